@@ -0,0 +1,233 @@
+import shutil
+import struct
+import subprocess
+import tempfile
+from io import BytesIO
+
+import numpy as np
+from matplotlib.colors import to_rgba_array
+from PIL import Image
+
+from raster_backend import blend_palette, image_layout, marker_mask, palette_image, stamp_dots
+
+# file extension and MIME type of every animation format
+ANIMATION_FORMATS = {"GIF": ("gif", "image/gif"), "MP4": ("mp4", "video/mp4")}
+
+# number of blends from white to every palette color in the GIF palette, for anti-aliased edges
+GIF_BLEND_LEVELS = 10
+
+
+def available_formats():
+    """
+    List the animation formats that can be encoded here; MP4 needs an `ffmpeg` executable on the PATH.
+
+    Returns:
+        list: The format names, e.g. ["GIF", "MP4"].
+    """
+    return ["GIF", "MP4"] if shutil.which("ffmpeg") else ["GIF"]
+
+
+def growth_frames(x, y, colors, marker_size, marker, figsize, dpi, equal_aspect=True, num_frames=100,
+                  progress_callback=None):
+    """
+    Rasterize a dot painting dot by dot and yield it as it grows.
+
+    The axes limits come from all the dots up front, so the layout never moves. Every frame stamps only
+    the dots added since the previous frame into one persistent buffer, so the total cost is that of a
+    single `render_dots` call plus copying the changed region of each frame; the last frame matches it.
+
+    Args:
+        x (np.ndarray): The x coordinates of the dots, in the order they appear.
+        y (np.ndarray): The y coordinates of the dots, in the order they appear.
+        colors (array-like): One color per dot (RGBA rows or hex strings).
+        marker_size (float): The marker size in points ** 2.
+        marker (str): The matplotlib marker of every dot.
+        figsize (float): The width and height of the figure in inches.
+        dpi (int): The resolution of the frames.
+        equal_aspect (bool): Whether the axes use an equal aspect ratio.
+        num_frames (int): The number of frames, the last one showing every dot.
+        progress_callback (callable, optional): Called with the fraction of frames yielded, before every frame.
+
+    Yields:
+        tuple: The (H, W, 3) uint8 frame and the (left, top, right, bottom) box of the pixels that changed
+            since the previous frame. The frame is the same buffer every time, updated in place.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    width, height, cols, rows, clip_box = image_layout(x, y, figsize, dpi, equal_aspect)
+    mask = marker_mask(marker, marker_size, dpi)
+    half_size = mask.shape[0] // 2
+    rgba = to_rgba_array(colors)
+    left, right, top, bottom = clip_box
+
+    canvas = np.full((height + 2 * half_size, width + 2 * half_size, 3), 255, dtype=np.uint8)
+    frame = np.full((height, width, 3), 255, dtype=np.uint8)
+    box = (0, 0, width, height)
+    start = 0
+    for count, end in enumerate(np.linspace(0, len(x), num_frames + 1).round().astype(int)[1:]):
+        if progress_callback is not None:
+            progress_callback(count / num_frames)
+        if end > start:
+            new = slice(start, end)
+            stamp_dots(canvas, cols[new] + half_size, rows[new] + half_size, rgba[new], mask)
+            # markers are clipped to the axes box
+            new_left = max(cols[new].min() - half_size, left)
+            new_right = min(cols[new].max() + half_size + 1, right)
+            new_top = max(rows[new].min() - half_size, top)
+            new_bottom = min(rows[new].max() + half_size + 1, bottom)
+            if new_left < new_right and new_top < new_bottom:
+                frame[new_top:new_bottom, new_left:new_right] = \
+                    canvas[half_size + new_top:half_size + new_bottom, half_size + new_left:half_size + new_right]
+                box = (new_left, new_top, new_right, new_bottom) if start else (0, 0, width, height)
+        yield frame, box
+        # a frame without new dots repeats a single unchanged pixel
+        box = (0, 0, 1, 1)
+        start = end
+
+
+def gif_palette(colors):
+    """
+    Build a GIF palette holding white and every palette color blended with white at a few levels.
+
+    Args:
+        colors (array-like): The palette colors (RGBA rows or hex strings).
+
+    Returns:
+        PIL.Image.Image: A "P" image carrying the palette, for `Image.quantize(palette=...)`.
+    """
+    return palette_image(blend_palette(colors, GIF_BLEND_LEVELS))
+
+
+def gif_image_block(image, palette):
+    """
+    Encode one image with Pillow and cut out its LZW data.
+
+    Pillow writes the palette unchanged, so the pixel values index the global color table of `write_gif`.
+
+    Args:
+        image (np.ndarray): The (H, W, 3) uint8 image.
+        palette (PIL.Image.Image): The palette to quantize to, see `gif_palette`.
+
+    Returns:
+        bytes: The LZW-compressed image data (minimum code size and sub-blocks).
+    """
+    buffer = BytesIO()
+    image = Image.fromarray(image).quantize(palette=palette, dither=Image.Dither.NONE)
+    # the frame descriptor written by `write_gif` is not interlaced
+    image.save(buffer, format="GIF", optimize=False, interlace=False)
+    data = buffer.getvalue()
+
+    flags = data[10]
+    position = 13
+    if flags & 0x80:
+        position += 3 * 2 ** ((flags & 0x07) + 1)
+    while data[position] == 0x21:  # skip extension blocks
+        position += 2
+        while data[position]:
+            position += data[position] + 1
+        position += 1
+
+    # image descriptor: separator, left, top, width, height, flags
+    descriptor_flags = data[position + 9]
+    position += 10
+    if descriptor_flags & 0x80:
+        position += 3 * 2 ** ((descriptor_flags & 0x07) + 1)
+    image_start = position
+    position += 1  # LZW minimum code size
+    while data[position]:
+        position += data[position] + 1
+    return data[image_start:position + 1]
+
+
+def write_gif(stream, frames, width, height, palette, fps=25):
+    """
+    Write an animated, looping GIF frame by frame.
+
+    The palette is written once as the global color table. Every frame only covers the box that changed
+    since the previous one and leaves the rest in place, and is written as soon as it is encoded, so no
+    more than one frame is ever held in memory.
+
+    Args:
+        stream (file-like): The binary stream to write to.
+        frames (iterable): The (frame, box) pairs from `growth_frames`.
+        width (int): The width of the frames in pixels.
+        height (int): The height of the frames in pixels.
+        palette (PIL.Image.Image): The palette to quantize to, see `gif_palette`.
+        fps (float): The number of frames per second.
+    """
+    delay = max(1, int(round(100 / fps)))  # hundredths of a second
+    color_table = bytes(palette.getpalette())
+    table_bits = int(np.log2(len(color_table) // 3)) - 1
+    # global color table of 8-bit colors
+    stream.write(b'GIF89a' + struct.pack('<HHBBB', width, height, 0xf0 | table_bits, 0, 0))
+    stream.write(color_table)
+    # loop forever
+    stream.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', 0) + b'\x00')
+    for frame, (left, top, right, bottom) in frames:
+        image_data = gif_image_block(frame[top:bottom, left:right], palette)
+        # graphic control: keep the previous frame underneath, then wait `delay`
+        stream.write(b'\x21\xf9\x04' + struct.pack('<BHBB', 1 << 2, delay, 0, 0))
+        stream.write(b'\x2c' + struct.pack('<HHHHB', left, top, right - left, bottom - top, 0))
+        stream.write(image_data)
+    stream.write(b'\x3b')
+
+
+def write_mp4(stream, frames, width, height, fps=25):
+    """
+    Pipe the frames into `ffmpeg` as raw video and write the H.264 MP4 it produces.
+
+    Args:
+        stream (file-like): The binary stream to write to.
+        frames (iterable): The (frame, box) pairs from `growth_frames`.
+        width (int): The width of the frames in pixels.
+        height (int): The height of the frames in pixels.
+        fps (float): The number of frames per second.
+    """
+    if not shutil.which("ffmpeg"):
+        raise RuntimeError("MP4 export needs an ffmpeg executable on the PATH")
+    with tempfile.TemporaryFile() as output:
+        command = ["ffmpeg", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}",
+                   "-r", f"{fps:g}", "-i", "pipe:0",
+                   # H.264 in yuv420p needs even dimensions
+                   "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2:color=white", "-c:v", "libx264", "-pix_fmt", "yuv420p",
+                   "-movflags", "frag_keyframe+empty_moov", "-f", "mp4", "pipe:1"]
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=output)
+        try:
+            for frame, _ in frames:
+                process.stdin.write(frame.tobytes())
+        finally:
+            process.stdin.close()
+            if process.wait():
+                raise RuntimeError(f"ffmpeg failed with exit code {process.returncode}")
+        output.seek(0)
+        shutil.copyfileobj(output, stream)
+
+
+def write_animation(stream, x, y, colors, marker_size, marker, figsize, dpi, equal_aspect=True, num_frames=100,
+                    fps=25, image_format="GIF", progress_callback=None):
+    """
+    Write an animation of a dot painting growing dot by dot.
+
+    Args:
+        stream (file-like): The binary stream to write to.
+        x (np.ndarray): The x coordinates of the dots, in the order they appear.
+        y (np.ndarray): The y coordinates of the dots, in the order they appear.
+        colors (array-like): One color per dot (RGBA rows or hex strings).
+        marker_size (float): The marker size in points ** 2.
+        marker (str): The matplotlib marker of every dot.
+        figsize (float): The width and height of the figure in inches.
+        dpi (int): The resolution of the frames.
+        equal_aspect (bool): Whether the axes use an equal aspect ratio.
+        num_frames (int): The number of frames.
+        fps (float): The number of frames per second.
+        image_format (str): Either "GIF" or "MP4".
+        progress_callback (callable, optional): Called with the fraction of frames encoded, see `growth_frames`.
+    """
+    frames = growth_frames(x, y, colors, marker_size, marker, figsize, dpi, equal_aspect, num_frames,
+                           progress_callback)
+    width, height = image_layout(np.asarray(x, dtype=float), np.asarray(y, dtype=float), figsize, dpi,
+                                 equal_aspect)[:2]
+    if image_format == "MP4":
+        write_mp4(stream, frames, width, height, fps)
+    else:
+        write_gif(stream, frames, width, height, gif_palette(np.unique(to_rgba_array(colors), axis=0)), fps)
@@ -0,0 +1,226 @@
+"""
+Benchmark rendering without Streamlit.
+
+Every canvas shape is rendered across a grid of canvas sizes, gap sizes and dot sizes, as SVG and as
+JPEG, PNG and WebP at every DPI option, and `BarnsleyFern.draw_fern` is timed on its own at 10^3 to
+10^7 points and, with `--fern-workers`, across numbers of worker processes.
+Each case records the best and median wall time over `--repeat` runs, the peak traced memory of one
+extra run and the size of the encoded image:
+
+    python benchmark.py --output results.json
+    python benchmark.py --sizes 228 --renderers Direct --output after.json --compare results.json
+
+Results are written as JSON; `--compare` matches cases by name against an earlier results file and
+reports the ones that got slower or hungrier by more than `--threshold`.
+"""
+import argparse
+import itertools
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import matplotlib
+
+matplotlib.use("Agg")  # headless, no GUI backend
+
+import numpy as np  # noqa: E402
+from barnsley_fern import BarnsleyFern  # noqa: E402
+from color_options import get_color_list  # noqa: E402
+from ifs import IFS_SHAPES  # noqa: E402
+from painting import CANVAS_LAYOUTS, render_painting  # noqa: E402
+
+CANVAS_SHAPES = CANVAS_LAYOUTS + ["barnsley fern"]
+
+# the resolutions offered for raster images in the app; SVG is resolution independent
+JPEG_DPIS = [100, 200, 300]
+SVG_DPI = 300
+
+FERN_POINTS = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark dot painting rendering.")
+    parser.add_argument("--canvas-shapes", nargs="+", default=CANVAS_SHAPES)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100, 228, 400, 800], help="canvas sizes")
+    parser.add_argument("--gap-sizes", nargs="+", type=int, default=[24])
+    parser.add_argument("--dot-sizes", nargs="+", type=float, default=[800])
+    parser.add_argument("--formats", nargs="+", choices=["SVG", "JPEG", "PNG", "WEBP"],
+                        default=["SVG", "JPEG", "PNG", "WEBP"])
+    parser.add_argument("--dpis", nargs="+", type=int, default=JPEG_DPIS, help="JPEG, PNG and WebP resolutions")
+    parser.add_argument("--renderers", nargs="+", choices=["Direct", "Matplotlib"], default=["Direct", "Matplotlib"])
+    parser.add_argument("--fern-points", nargs="+", type=int, default=[1000],
+                        help="number of points of the barnsley fern and the other IFS canvas shapes")
+    parser.add_argument("--draw-fern-points", nargs="*", type=int, default=FERN_POINTS,
+                        help="number of points for timing draw_fern on its own, empty to skip")
+    parser.add_argument("--fern-workers", nargs="+", type=int, default=[1],
+                        help="numbers of worker processes for timing draw_fern, e.g. 1 2 4 8 for its scaling")
+    parser.add_argument("--palette", default="Pop Art")
+    parser.add_argument("--num-colors", type=int, default=10)
+    parser.add_argument("--figsize-ratio", type=float, default=3.33)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case")
+    parser.add_argument("--output", default="benchmark.json", help="JSON results file")
+    parser.add_argument("--compare", help="earlier JSON results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="ratio to the earlier results above which a case counts as a regression")
+    return parser.parse_args(argv)
+
+
+def measure(function, repeat):
+    """
+    Time `function` and trace its peak memory.
+
+    One untimed run warms up caches (marker masks, fonts); then `repeat` runs are timed without tracing,
+    since tracemalloc slows down allocation-heavy code, and a last run is traced for the peak memory.
+    tracemalloc sees Python and NumPy allocations but not the Agg renderer's own C++ buffers.
+
+    Args:
+        function (callable): The work to measure, called without arguments.
+        repeat (int): The number of timed runs.
+
+    Returns:
+        dict: The best and median seconds, the peak traced bytes and the value returned by the last run.
+    """
+    function()
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        value = function()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds_min": min(seconds), "seconds_median": statistics.median(seconds), "peak_bytes": peak_bytes,
+            "value": value}
+
+
+def render_cases(args):
+    """
+    Build one render case for every canvas shape, size, gap size, dot size, format, DPI and renderer.
+
+    Args:
+        args (argparse.Namespace): The parsed command line.
+
+    Returns:
+        list: The `render_painting` keyword arguments of every case.
+    """
+    outputs = [(image_format, dpi) for image_format in args.formats
+               for dpi in ([SVG_DPI] if image_format == "SVG" else args.dpis)]
+    cases = []
+    grid = itertools.product(args.canvas_shapes, args.sizes, args.gap_sizes, args.dot_sizes, outputs, args.renderers)
+    for canvas_shape, size, gap_size, dot_size, (image_format, dpi), renderer in grid:
+        for n in args.fern_points if canvas_shape in IFS_SHAPES else [1000]:
+            cases.append({"dot_size": dot_size, "gap_size": gap_size, "canvas_size": size,
+                          "canvas_shape": canvas_shape, "shape": "circle", "dpi": dpi,
+                          "figsize_ratio": args.figsize_ratio, "image_format": image_format,
+                          "renderer": renderer, "n": n})
+    return cases
+
+
+def case_name(case):
+    """
+    Name a render case after the parameters the grid varies, to match it between runs.
+
+    Args:
+        case (dict): The `render_painting` keyword arguments.
+
+    Returns:
+        str: The name, e.g. "render/golden ratio/size228/gap24/dot800/JPEG300/Direct".
+    """
+    name = (f"render/{case['canvas_shape']}/size{case['canvas_size']}/gap{case['gap_size']}/dot{case['dot_size']:g}"
+            f"/{case['image_format']}{case['dpi'] if case['image_format'] != 'SVG' else ''}/{case['renderer']}")
+    if case["canvas_shape"] in IFS_SHAPES:
+        name += f"/n{case['n']}"
+    return name
+
+
+def run_benchmarks(args):
+    """
+    Run every render case and every draw_fern case.
+
+    Args:
+        args (argparse.Namespace): The parsed command line.
+
+    Returns:
+        list: One result dict per case.
+    """
+    color_list = get_color_list(args.palette, args.num_colors)
+    results = []
+
+    def report(result):
+        results.append(result)
+        print(f"{result['seconds_min']:9.4f}s {result['peak_bytes'] / 2 ** 20:9.1f} MiB  {result['name']}",
+              file=sys.stderr, flush=True)
+
+    for case in render_cases(args):
+        measured = measure(lambda: render_painting(color_list, **case), args.repeat)
+        output_bytes = len(measured.pop("value"))
+        report(dict(name=case_name(case), kind="render", **case, **measured, output_bytes=output_bytes))
+
+    for n, workers in itertools.product(args.draw_fern_points, args.fern_workers):
+        measured = measure(lambda: BarnsleyFern(seed=0).draw_fern(n, color_list, workers=workers), args.repeat)
+        measured.pop("value")
+        name = f"draw_fern/n{n}" if workers == 1 else f"draw_fern/n{n}/workers{workers}"
+        report(dict(name=name, kind="draw_fern", n=n, workers=workers, **measured))
+    return results
+
+
+def compare(results, earlier, threshold):
+    """
+    Print the time and memory ratios of every case also present in an earlier results file.
+
+    Args:
+        results (list): The current results.
+        earlier (dict): The earlier results document.
+        threshold (float): The ratio above which a case counts as a regression.
+
+    Returns:
+        int: The number of regressions.
+    """
+    earlier_results = {result["name"]: result for result in earlier["results"]}
+    regressions = 0
+    for result in results:
+        before = earlier_results.get(result["name"])
+        if before is None:
+            continue
+        time_ratio = result["seconds_min"] / max(before["seconds_min"], 1e-9)
+        memory_ratio = result["peak_bytes"] / max(before["peak_bytes"], 1)
+        regressed = time_ratio > threshold or memory_ratio > threshold
+        regressions += regressed
+        print(f"{time_ratio:7.2f}x time {memory_ratio:7.2f}x memory  {result['name']}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_benchmarks(args)
+    document = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": {"python": platform.python_version(), "numpy": np.__version__,
+                        "matplotlib": matplotlib.__version__, "machine": platform.machine(),
+                        "platform": platform.platform()},
+        "repeat": args.repeat,
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(document, file, indent=2)
+    print(f"wrote {len(results)} results to {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        print(f"{regressions} regressions above {args.threshold:g}x")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,58 +1,109 @@
-import streamlit as st
 import matplotlib.cm as cm
 import numpy as np
+from matplotlib.colors import to_rgba_array
 
-def get_color_list(color_style, num_colors):
-    if color_style == "Pop Art":
-        return ["#03BFAC", "#75DFCA", "#1DBACC", "#ED3192", "#087FBF"]
-    elif color_style == "Harmony Hues":
-        return ["#EFE0F3", "#325A94", "#EB9759", "#CF0A33", "#924265",
-                "#E8D05A", "#ED4569", "#3BAE47", "#7CB6A4", "#3C896E",
-                "#75A6D1", "#F94318", "#C791A8", "#F1F8F4", "#758B41",
-                "#896CB8", "#B1B519", "#026A4A", "#C9D306", "#2D2A65",
-                "#015574", "#B2C7B3", "#403C38", "#4C2F36", "#28A3D2",
-                "#2C2359", "#DAAFBB", "#E7ACA3"]
+# palettes with a fixed list of colors, the number of colors is ignored
+FIXED_PALETTES = {
+    "Pop Art": ["#03BFAC", "#75DFCA", "#1DBACC", "#ED3192", "#087FBF"],
+    "Harmony Hues": ["#EFE0F3", "#325A94", "#EB9759", "#CF0A33", "#924265",
+                     "#E8D05A", "#ED4569", "#3BAE47", "#7CB6A4", "#3C896E",
+                     "#75A6D1", "#F94318", "#C791A8", "#F1F8F4", "#758B41",
+                     "#896CB8", "#B1B519", "#026A4A", "#C9D306", "#2D2A65",
+                     "#015574", "#B2C7B3", "#403C38", "#4C2F36", "#28A3D2",
+                     "#2C2359", "#DAAFBB", "#E7ACA3"],
     # Monochromatic 1
-    elif color_style == "Mono 1":
-        return ["#0000FF", "#1111FF", "#2222FF", "#3333FF", "#4444FF",
-                "#5555FF", "#6666FF", "#7777FF", "#8888FF", "#9999FF"]
-    # Monochromatic 2
-    elif color_style == "Mono 2":
-        base_color = st.color_picker("Choose a Base Color", "#0000FF")
-        monochromatic_colors = [base_color]
-        for i in range(1, 10):
-            shade = base_color.replace("#", f"#{i * 1:02X}")
-            monochromatic_colors.append(shade)
-        return monochromatic_colors
-    # Perceptually Uniform Sequential
-    elif color_style in ["Viridis", "Plasma", "Inferno", "Magma", "Cividis"]:
-        colormap = getattr(cm, color_style.lower())  # Correct the color_style name
-        return [colormap(x) for x in np.linspace(0, 1, 25)]
+    "Mono 1": ["#0000FF", "#1111FF", "#2222FF", "#3333FF", "#4444FF",
+               "#5555FF", "#6666FF", "#7777FF", "#8888FF", "#9999FF"],
+}
+
+# Perceptually Uniform Sequential, always sampled at 25 colors
+UNIFORM_COLORMAPS = ["Viridis", "Plasma", "Inferno", "Magma", "Cividis"]
+UNIFORM_NUM_COLORS = 25
+
+# colormaps sampled at the requested number of colors
+COLORMAPS = [
     # Qualitative
-    elif color_style in ["Pastel1", "Pastel2", "Paired", "Accent", "Dark2", "Set1", "Set2", "Set3", "tab10", "tab20", "tab20b", "tab20c"]:
-        colormap = getattr(cm, color_style)
-        return [colormap(x) for x in np.linspace(0, 1, num_colors)]
+    "Pastel1", "Pastel2", "Paired", "Accent", "Dark2", "Set1", "Set2", "Set3", "tab10", "tab20", "tab20b", "tab20c",
     # Sequential
-    elif color_style in ['Greys', 'Purples', 'Blues', 'Greens', 'Oranges', 'Reds', 'YlOrBr', 'YlOrRd', 'OrRd', 'PuRd',
-                         'RdPu', 'BuPu', 'GnBu', 'PuBu', 'YlGnBu', 'PuBuGn', 'BuGn', 'YlGn']:
-        colormap = getattr(cm, color_style)  # Correct the color_style name
-        return [colormap(x) for x in np.linspace(0, 1, num_colors)]
+    'Greys', 'Purples', 'Blues', 'Greens', 'Oranges', 'Reds', 'YlOrBr', 'YlOrRd', 'OrRd', 'PuRd',
+    'RdPu', 'BuPu', 'GnBu', 'PuBu', 'YlGnBu', 'PuBuGn', 'BuGn', 'YlGn',
     # Sequential2
-    elif color_style in ['binary', 'gist_yarg', 'gist_gray', 'gray', 'bone', 'pink', 'spring', 'summer', 'autumn', 'winter', 'cool', 'Wistia', 'hot', 'afmhot', 'gist_heat', 'copper']:
-        colormap = getattr(cm, color_style)  # Correct the color_style name
-        return [colormap(x) for x in np.linspace(0, 1, num_colors)]
+    'binary', 'gist_yarg', 'gist_gray', 'gray', 'bone', 'pink', 'spring', 'summer', 'autumn', 'winter', 'cool',
+    'Wistia', 'hot', 'afmhot', 'gist_heat', 'copper',
     # Cyclic
-    elif color_style in ['twilight', 'twilight_shifted', 'hsv']:
-        colormap = getattr(cm, color_style)  # Correct the color_style name
-        return [colormap(x) for x in np.linspace(0, 1, num_colors)]
+    'twilight', 'twilight_shifted', 'hsv',
     # Diverging
-    elif color_style in ['PiYG', 'PRGn', 'BrBG', 'PuOr', 'RdGy', 'RdBu', 'RdYlBu', 'RdYlGn', 'Spectral', 'coolwarm', 'bwr', 'seismic']:
-        colormap = getattr(cm, color_style)  # Correct the color_style name
-        return [colormap(x) for x in np.linspace(0, 1, num_colors)]
+    'PiYG', 'PRGn', 'BrBG', 'PuOr', 'RdGy', 'RdBu', 'RdYlBu', 'RdYlGn', 'Spectral', 'coolwarm', 'bwr', 'seismic',
     # Miscellaneous
-    elif color_style in ['flag', 'prism', 'ocean', 'gist_earth', 'terrain', 'gist_stern', 'gnuplot', 'gnuplot2', 'CMRmap', 'cubehelix', 'brg', 'gist_rainbow', 'rainbow', 'jet', 'turbo', 'nipy_spectral', 'gist_ncar']:
-        colormap = getattr(cm, color_style)  # Correct the color_style name
-        return [colormap(x) for x in np.linspace(0, 1, num_colors)]
-        colormap = getattr(cm, color_style)  # Correct the color_style name
-    else:
-        return []  # Return an empty list if the color style is not recognized
+    'flag', 'prism', 'ocean', 'gist_earth', 'terrain', 'gist_stern', 'gnuplot', 'gnuplot2', 'CMRmap', 'cubehelix',
+    'brg', 'gist_rainbow', 'rainbow', 'jet', 'turbo', 'nipy_spectral', 'gist_ncar',
+]
+
+
+def build_palettes():
+    """
+    Build every palette once as a float32 (N, 4) RGBA array.
+
+    Fixed palettes hold their colors; colormaps hold their full lookup table, which `get_color_list`
+    samples with a single index operation.
+
+    Returns:
+        dict: The palette arrays by color style.
+    """
+    palettes = {name: to_rgba_array(colors).astype(np.float32) for name, colors in FIXED_PALETTES.items()}
+    for name in UNIFORM_COLORMAPS + COLORMAPS:
+        colormap = getattr(cm, name.lower() if name in UNIFORM_COLORMAPS else name)
+        # integer inputs index the lookup table directly
+        palettes[name] = colormap(np.arange(colormap.N)).astype(np.float32)
+    for palette in palettes.values():
+        # shared by every session and renderer, so guard against in-place edits
+        palette.flags.writeable = False
+    return palettes
+
+
+PALETTES = build_palettes()
+
+
+def sample_colormap(lookup_table, num_colors):
+    """
+    Pick `num_colors` evenly spaced colors from a colormap lookup table.
+
+    Gives the same colors as calling the colormap at `np.linspace(0, 1, num_colors)`.
+
+    Args:
+        lookup_table (np.ndarray): The (N, 4) colors of the colormap.
+        num_colors (int): The number of colors to pick.
+
+    Returns:
+        np.ndarray: The (num_colors, 4) picked colors.
+    """
+    size = len(lookup_table)
+    return lookup_table[np.minimum((np.linspace(0, 1, num_colors) * size).astype(np.intp), size - 1)]
+
+
+def get_color_list(color_style, num_colors, base_color="#0000FF"):
+    """
+    Look up the colors of a color style.
+
+    Args:
+        color_style (str): The name of the color style, e.g. "Pop Art" or "Viridis".
+        num_colors (int): The number of colors picked from a colormap.
+        base_color (str): The hex base color of the "Mono 2" style.
+
+    Returns:
+        np.ndarray: The float32 (N, 4) RGBA colors, empty if the color style is not recognized.
+    """
+    # Monochromatic 2, built from the user's base color
+    if color_style == "Mono 2":
+        monochromatic_colors = [base_color]
+        for i in range(1, 10):
+            shade = base_color.replace("#", f"#{i * 1:02X}")
+            monochromatic_colors.append(shade)
+        return to_rgba_array(monochromatic_colors).astype(np.float32)
+
+    palette = PALETTES.get(color_style)
+    if palette is None:
+        return np.empty((0, 4), dtype=np.float32)  # Return no colors if the color style is not recognized
+    if color_style in FIXED_PALETTES:
+        return palette
+    return sample_colormap(palette, UNIFORM_NUM_COLORS if color_style in UNIFORM_COLORMAPS else num_colors)
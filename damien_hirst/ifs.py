@@ -0,0 +1,530 @@
+import copy
+import functools
+import json
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# shards of the chaos game per worker process in the parallel mode, to report progress between them
+SHARDS_PER_WORKER = 4
+
+# state shared with the shard workers, set once per process by `init_worker`
+worker_state = {}
+
+# how far `attractor_bounds` may fall short of the attractor, relative to its size
+BOUNDS_TOLERANCE = 1e-5
+
+# strongest contraction factor of a user map; framing takes rounds in proportion to 1 / (1 - contraction)
+MAX_CONTRACTION = 0.99
+
+# rounds of `attractor_bounds`, enough for the tolerance at `MAX_CONTRACTION`
+MAX_BOUNDS_ROUNDS = int(np.ceil(np.log(BOUNDS_TOLERANCE) / np.log(MAX_CONTRACTION)))
+
+# thinnest frame of an attractor, as its short side over its long side; lines and points are padded to it
+MIN_BOUNDS_ASPECT = 0.1
+
+# number of attractors whose bounds are remembered, so generators of the same maps frame them once
+BOUNDS_CACHE_SIZE = 64
+
+# the maps of every preset as [[a, b, e], [c, d, f]], i.e. x' = a * x + b * y + e and y' = c * x + d * y + f,
+# in the same format as user definitions, see `parse_ifs`
+IFS_PRESETS = {
+    # Source: https://high-python-ext-1-doing-math.readthedocs.io/en/latest/chapter6.html
+    "barnsley fern": {
+        "maps": [[[0.85, 0.04, 0.0], [-0.04, 0.85, 1.6]],
+                 [[0.2, -0.26, 0.0], [0.23, 0.22, 1.6]],
+                 [[-0.15, 0.28, 0.0], [0.26, 0.24, 0.44]],
+                 [[0.0, 0.0, 0.0], [0.0, 0.16, 0.0]]],
+        "probabilities": [0.85, 0.07, 0.07, 0.01],
+    },
+    # mutant varieties of the fern, see https://en.wikipedia.org/wiki/Barnsley_fern
+    "cyclosorus fern": {
+        "maps": [[[0.95, 0.005, -0.002], [-0.005, 0.93, 0.5]],
+                 [[0.035, -0.2, -0.09], [0.16, 0.04, 0.02]],
+                 [[-0.04, 0.2, 0.083], [0.16, 0.04, 0.12]],
+                 [[0.0, 0.0, 0.0], [0.0, 0.25, -0.4]]],
+        "probabilities": [0.84, 0.07, 0.07, 0.02],
+    },
+    "culcita fern": {
+        "maps": [[[0.85, 0.02, 0.0], [-0.02, 0.83, 1.0]],
+                 [[0.09, -0.28, 0.0], [0.3, 0.11, 0.6]],
+                 [[-0.09, 0.28, 0.0], [0.3, 0.09, 0.7]],
+                 [[0.0, 0.0, 0.0], [0.0, 0.25, -0.14]]],
+        "probabilities": [0.84, 0.07, 0.07, 0.02],
+    },
+    "sierpinski triangle": {
+        "maps": [[[0.5, 0.0, 0.0], [0.0, 0.5, 0.0]],
+                 [[0.5, 0.0, 0.5], [0.0, 0.5, 0.0]],
+                 [[0.5, 0.0, 0.25], [0.0, 0.5, 0.4330127]]],
+        "probabilities": [1 / 3, 1 / 3, 1 / 3],
+    },
+    # the Heighway dragon
+    "dragon curve": {
+        "maps": [[[0.5, -0.5, 0.0], [0.5, 0.5, 0.0]],
+                 [[-0.5, -0.5, 1.0], [0.5, -0.5, 0.0]]],
+        "probabilities": [0.5, 0.5],
+    },
+    # Barnsley, Fractals Everywhere
+    "maple leaf": {
+        "maps": [[[0.14, 0.01, -0.08], [0.0, 0.51, -1.31]],
+                 [[0.43, 0.52, 1.49], [-0.45, 0.5, -0.75]],
+                 [[0.45, -0.49, -1.62], [0.47, 0.47, -0.74]],
+                 [[0.49, 0.0, 0.02], [0.0, 0.51, 1.62]]],
+        "probabilities": [0.1, 0.35, 0.35, 0.2],
+    },
+}
+
+# the canvas shape drawn from a user-supplied definition
+CUSTOM_IFS = "custom IFS"
+
+# every canvas shape drawn by the chaos game
+IFS_SHAPES = list(IFS_PRESETS) + [CUSTOM_IFS]
+
+
+def parse_ifs(definition):
+    """
+    Read the maps and probabilities of an iterated function system.
+
+    A definition is a JSON object (or its text) with "maps", a list of [[a, b, e], [c, d, f]] affine maps,
+    and optionally "probabilities", one weight per map. Without weights, every map is picked in proportion
+    to the area it keeps, |a * d - b * c|, so the attractor fills in evenly.
+
+    Args:
+        definition (dict or str): The definition, or its JSON text.
+
+    Returns:
+        tuple: The (k, 2, 3) coefficients and the k probabilities, summing to one.
+
+    Raises:
+        ValueError: If the definition is malformed or a map does not shrink every distance to at most
+            `MAX_CONTRACTION` times its length.
+    """
+    if isinstance(definition, str):
+        definition = json.loads(definition)
+    if not isinstance(definition, dict) or "maps" not in definition:
+        raise ValueError('an IFS definition is a JSON object with a "maps" list')
+    try:
+        coefficients = np.asarray(definition["maps"], dtype=float)
+    except (TypeError, ValueError):
+        coefficients = np.empty(0)
+    if coefficients.ndim != 3 or coefficients.shape[1:] != (2, 3) or not len(coefficients):
+        raise ValueError("every IFS map is a [[a, b, e], [c, d, f]] list")
+
+    linear = coefficients[:, :, :2]
+    if "probabilities" in definition:
+        try:
+            probability = np.asarray(definition["probabilities"], dtype=float)
+        except (TypeError, ValueError):
+            probability = np.empty(0)
+        if probability.shape != (len(coefficients),) or (probability < 0).any() or not probability.sum() > 0:
+            raise ValueError("an IFS needs one non-negative probability per map")
+    else:
+        # maps that collapse the plane onto a line still need the odd point
+        probability = np.maximum(np.abs(np.linalg.det(linear)), 0.01)
+    if not np.isfinite(coefficients).all() or not np.isfinite(probability).all():
+        raise ValueError("IFS coefficients and probabilities must be finite")
+    if (np.linalg.norm(linear, ord=2, axis=(1, 2)) > MAX_CONTRACTION).any():
+        raise ValueError(f"every IFS map must contract, i.e. shrink every distance to at most {MAX_CONTRACTION:g} "
+                         f"times its length")
+    return coefficients, probability / probability.sum()
+
+
+def convex_hull(points, tolerance=0.0):
+    """
+    Find the convex hull of a set of points with Andrew's monotone chain.
+
+    Args:
+        points (np.ndarray): The (N, 2) points.
+        tolerance (float): Vertices closer than this to the line through their neighbors are dropped.
+
+    Returns:
+        np.ndarray: The hull vertices, counterclockwise.
+    """
+    points = np.unique(points, axis=0)  # sorted by x, then y
+    if len(points) < 3:
+        return points
+
+    def half_hull(ordered):
+        chain = []
+        for x, y in ordered.tolist():
+            # drop the last vertex while the chain does not turn left by more than the tolerance
+            while len(chain) >= 2:
+                (x0, y0), (x1, y1) = chain[-2], chain[-1]
+                cross = (x1 - x0) * (y - y0) - (y1 - y0) * (x - x0)
+                if cross > tolerance * np.hypot(x - x0, y - y0):
+                    break
+                chain.pop()
+            chain.append((x, y))
+        return chain[:-1]
+
+    return np.array(half_hull(points) + half_hull(points[::-1]))
+
+
+def attractor_bounds(coefficients, start, tolerance=BOUNDS_TOLERANCE):
+    """
+    Frame the attractor of contracting affine maps without sampling it.
+
+    An affine map takes the convex hull of a set to the convex hull of its image, so the hull of the
+    images of the hull vertices under every map is the hull of the next level of attractor points.
+    Starting from a single point on the attractor, the hulls converge to the hull of the attractor as
+    fast as the weakest contraction shrinks distances, which bounds the number of rounds needed.
+
+    Args:
+        coefficients (np.ndarray): The (k, 2, 3) contracting affine maps.
+        start (np.ndarray): A point on the attractor, e.g. the fixed point of a map.
+        tolerance (float): How far the box may fall short of the attractor, relative to its size.
+
+    Returns:
+        tuple: The bounding box of the attractor as (x_min, x_max, y_min, y_max), padded to
+            `MIN_BOUNDS_ASPECT` around attractors that are (nearly) a line or a point.
+    """
+    linear, offset = coefficients[:, :, :2], coefficients[:, :, 2]
+    contraction = np.linalg.norm(linear, ord=2, axis=(1, 2)).max()
+    hull = np.asarray(start, dtype=float)[np.newaxis]
+
+    def grow(hull, tolerance):
+        # the image of every hull vertex under every map, as one (k * vertices, 2) array
+        return convex_hull((hull @ linear.transpose(0, 2, 1) + offset[:, np.newaxis]).reshape(-1, 2), tolerance)
+
+    # the first round moves the hull by `step`, every later round by `contraction` times less, so the
+    # attractor lies within step / (1 - contraction) of the start
+    first = grow(hull, 0.0)
+    size = np.abs(first - hull).max() / (1 - contraction)
+    hull = first
+    num_rounds = int(np.ceil(np.log(tolerance) / np.log(contraction))) if 0 < contraction else 1
+    # weaker contractions than parse_ifs accepts are framed less accurately rather than for minutes
+    num_rounds = min(num_rounds, MAX_BOUNDS_ROUNDS)
+    for _ in range(num_rounds):
+        # dropping nearly straight vertices keeps the hull small at a cost within the tolerance
+        hull = grow(hull, tolerance * size * (1 - contraction))
+
+    low, high = hull.min(axis=0), hull.max(axis=0)
+    # a frame with some area, so that the attractor can be mapped onto pixels
+    longest = (high - low).max()
+    span = longest * MIN_BOUNDS_ASPECT if longest > 0 else 1.0
+    padding = np.maximum(span - (high - low), 0) / 2
+    low, high = low - padding, high + padding
+    return low[0], high[0], low[1], high[1]
+
+
+@functools.lru_cache(maxsize=BOUNDS_CACHE_SIZE)
+def cached_bounds(coefficient_bytes, start_bytes):
+    """
+    Memoize `attractor_bounds` on the raw bytes of its float64 arguments, which unlike arrays are hashable.
+
+    Returns:
+        tuple: The bounding box of the attractor as (x_min, x_max, y_min, y_max).
+    """
+    return attractor_bounds(np.frombuffer(coefficient_bytes).reshape(-1, 2, 3), np.frombuffer(start_bytes))
+
+
+class IteratedFunctionSystem:
+    """
+    Vectorized chaos-game generator for the attractor of an iterated function system (IFS).
+
+    The k affine maps are stored as one stacked (k, 2, 3) coefficient array where each map is
+    [[a, b, e], [c, d, f]], i.e. x' = a * x + b * y + e and y' = c * x + d * y + f.
+
+    Instead of advancing a single point per Python iteration, a population of walkers is advanced
+    in lock-step: every step applies a randomly chosen map to all walkers at once. All walkers start
+    at the fixed point of the first map that is ever picked, which lies on the attractor, and are iterated for `burn_in`
+    steps before any point is recorded, so the recorded points are spread over the whole attractor.
+
+    Attributes:
+        coefficients (np.ndarray): The stacked affine maps, shape (k, 2, 3).
+        probability (np.ndarray): The probability of picking each map.
+        start (np.ndarray): The fixed point of the first map ever picked, where every walker starts.
+        bounds (tuple): The bounding box of the attractor as (x_min, x_max, y_min, y_max), computed up
+            front so a plot can be framed before any point is drawn.
+        num_walkers (int): The maximum number of points advanced together per step.
+        burn_in (int): The number of unrecorded steps before points are collected.
+        rng (np.random.Generator): The generator every map index and color is drawn from.
+    """
+
+    def __init__(self, coefficients, probability, num_walkers=16384, burn_in=20, seed=None):
+        """
+        Initialize the IteratedFunctionSystem class.
+
+        Args:
+            coefficients (array-like): The (k, 2, 3) contracting affine maps, see `parse_ifs`.
+            probability (array-like): The probability of picking each map, summing to one.
+            num_walkers (int): The maximum number of points advanced together per step.
+            burn_in (int): The number of unrecorded steps before points are collected.
+            seed (int or np.random.Generator, optional): The seed, or an existing generator to share.
+        """
+        self.coefficients = np.asarray(coefficients, dtype=float)
+        self.probability = np.asarray(probability, dtype=float)
+        self.num_walkers = num_walkers
+        self.burn_in = burn_in
+        self.rng = np.random.default_rng(seed)
+        # precompute the cumulative distribution once instead of on every step
+        self.cumulative_probability = np.cumsum(self.probability)
+        # maps that are never picked do not shape the attractor
+        used = self.coefficients[self.probability > 0]
+        self.start = np.linalg.solve(np.eye(2) - used[0, :, :2], used[0, :, 2])
+        self.bounds = cached_bounds(used.tobytes(), self.start.tobytes())
+
+    def get_indices(self, size):
+        """
+        Draw `size` map indices in one batch.
+
+        Args:
+            size (int or tuple): The shape of the returned index array.
+
+        Returns:
+            np.ndarray: Indices into `coefficients`, distributed according to `probability`.
+        """
+        r = self.rng.random(size)
+        indices = np.searchsorted(self.cumulative_probability, r, side='left')
+        # guard against floating point round-off in the last cumulative value
+        return np.minimum(indices, len(self.probability) - 1)
+
+    def iterate_points(self, n, chunk_size=None, progress_callback=None, num_ticks=20):
+        """
+        Run the chaos game and yield the `n` points in chunks.
+
+        Only one chunk of points (and of map indices) is held in memory at a time, so memory use
+        depends on `chunk_size` and not on `n`.
+
+        Args:
+            n (int): The total number of points to generate.
+            chunk_size (int, optional): The maximum number of points per chunk. Defaults to `n`.
+            progress_callback (callable, optional): Called with the completed fraction (0 to 1).
+            num_ticks (int): The maximum number of times `progress_callback` is called.
+
+        Yields:
+            tuple: The x and y coordinates of the next chunk of points, a single empty chunk if `n` is 0.
+        """
+        if n == 0:
+            # without points there are no walkers to step
+            yield np.empty(0), np.empty(0)
+            return
+        num_walkers = max(1, min(n, self.num_walkers))
+        num_steps = -(-n // num_walkers)  # ceiling division
+        chunk_steps = num_steps if chunk_size is None else max(1, chunk_size // num_walkers)
+        a, b, e = self.coefficients[:, 0, 0], self.coefficients[:, 0, 1], self.coefficients[:, 0, 2]
+        c, d, f = self.coefficients[:, 1, 0], self.coefficients[:, 1, 1], self.coefficients[:, 1, 2]
+
+        # every walker starts on the attractor
+        px = np.full(num_walkers, self.start[0])
+        py = np.full(num_walkers, self.start[1])
+        for t in self.get_indices((self.burn_in, num_walkers)):
+            px, py = a[t] * px + b[t] * py + e[t], c[t] * px + d[t] * py + f[t]
+
+        tick_every = -(-num_steps // num_ticks)
+        remaining = n
+        for first_step in range(0, num_steps, chunk_steps):
+            # draw every map index of the chunk up front, one row per step
+            indices = self.get_indices((min(chunk_steps, num_steps - first_step), num_walkers))
+            x = np.empty(indices.shape)
+            y = np.empty(indices.shape)
+            for step, t in enumerate(indices):
+                px, py = a[t] * px + b[t] * py + e[t], c[t] * px + d[t] * py + f[t]
+                x[step] = px
+                y[step] = py
+                if progress_callback is not None and (first_step + step) % tick_every == 0:
+                    progress_callback((first_step + step) / num_steps)
+
+            count = min(remaining, x.size)
+            remaining -= count
+            yield x.ravel()[:count], y.ravel()[:count]
+
+    def run_shards(self, shard_function, n, workers, state, progress_callback=None, num_ticks=20):
+        """
+        Split the chaos game for `n` points into shards and run them across a pool of worker processes.
+
+        Every shard runs on a copy of the generator with its own random stream, spawned from the
+        `SeedSequence` of `self.rng`, so the result depends on the seed and the number of workers but
+        not on which worker runs which shard or in what order. A pool is started for every call, so
+        this pays off from millions of points on.
+
+        Args:
+            shard_function (callable): Runs one (generator, first point, number of points) shard inside a
+                worker and writes its result into the shared memory named in `state`.
+            n (int): The total number of points.
+            workers (int): The number of worker processes.
+            state (dict): The state every worker starts from, see `init_worker`.
+            progress_callback (callable, optional): Called with the completed fraction as shards finish.
+            num_ticks (int): The maximum number of times `progress_callback` is called.
+        """
+        num_shards = workers * SHARDS_PER_WORKER
+        starts = np.linspace(0, n, num_shards + 1).round().astype(int)
+        tasks = []
+        for seed, start, end in zip(self.rng.bit_generator.seed_seq.spawn(num_shards), starts[:-1], starts[1:]):
+            shard = copy.copy(self)
+            shard.rng = np.random.default_rng(seed)
+            tasks.append((shard, int(start), int(end - start)))
+
+        next_plane = multiprocessing.Value('i', 0)
+        with multiprocessing.Pool(workers, initializer=init_worker, initargs=(state, next_plane)) as pool:
+            for done, _ in enumerate(pool.imap_unordered(shard_function, tasks), 1):
+                # at most `num_ticks` calls, whatever the number of shards
+                tick = done * num_ticks // num_shards
+                if progress_callback is not None and tick > (done - 1) * num_ticks // num_shards:
+                    progress_callback(done / num_shards)
+
+    def draw_points(self, n, color_list, progress_callback=None, num_ticks=20, metrics=None, workers=1):
+        """
+        Generate `n` points of the attractor together with a randomly picked color per point.
+
+        Args:
+            n (int): The number of points to generate.
+            color_list (np.ndarray): The (N, 4) RGBA colors to pick from.
+            progress_callback (callable, optional): Called with the completed fraction (0 to 1).
+            num_ticks (int): The maximum number of times `progress_callback` is called.
+            metrics (RenderMetrics, optional): Collects the "fern points" and "fern colors" stage timings.
+            workers (int): The number of worker processes running the chaos game. With more than one, the
+                workers write their points straight into shared memory instead of sending them back.
+
+        Returns:
+            tuple: The x coordinates, the y coordinates and the colors, each of length `n`.
+        """
+        if workers > 1:
+            memory = shared_memory.SharedMemory(create=True, size=max(1, 2 * n * 8))
+            try:
+                self.run_shards(points_shard, n, workers, {'memory_name': memory.name, 'n': n},
+                                progress_callback, num_ticks)
+                x, y = np.ndarray((2, n), buffer=memory.buf).copy()
+            finally:
+                memory.close()
+                memory.unlink()
+        else:
+            x, y = next(self.iterate_points(n, progress_callback=progress_callback, num_ticks=num_ticks))
+        if metrics is not None:
+            metrics.split("fern points")
+            metrics.count("fern_points", len(x))
+
+        # pick a color for every point with a single index draw
+        colors = np.asarray(color_list)[self.rng.integers(len(color_list), size=n)]
+        if metrics is not None:
+            metrics.split("fern colors")
+
+        return x, y, colors
+
+    def count_hits(self, counts, n, width, height, chunk_size=2 ** 20, progress_callback=None, num_ticks=20):
+        """
+        Add the pixel hits of `n` points of the attractor to a flat histogram, in place.
+
+        Args:
+            counts (np.ndarray): The flat (height * width) int64 histogram to add to.
+            n (int): The number of points to generate.
+            width (int): The number of histogram columns.
+            height (int): The number of histogram rows.
+            chunk_size (int): The maximum number of points generated at once.
+            progress_callback (callable, optional): Called with the completed fraction (0 to 1).
+            num_ticks (int): The maximum number of times `progress_callback` is called.
+        """
+        x_min, x_max, y_min, y_max = self.bounds
+        for x, y in self.iterate_points(n, chunk_size, progress_callback, num_ticks):
+            col = np.clip(((x - x_min) / (x_max - x_min) * width).astype(np.intp), 0, width - 1)
+            row = np.clip(((y_max - y) / (y_max - y_min) * height).astype(np.intp), 0, height - 1)
+            counts += np.bincount(row * width + col, minlength=height * width)
+
+    def draw_density(self, n, width, height, chunk_size=2 ** 20, progress_callback=None, num_ticks=20,
+                     metrics=None, workers=1):
+        """
+        Accumulate `n` points of the attractor into a 2D histogram of hits per pixel.
+
+        The chaos game runs in chunks of `chunk_size` points, so memory stays constant regardless of `n`.
+
+        Args:
+            n (int): The number of points to generate.
+            width (int): The number of histogram columns.
+            height (int): The number of histogram rows.
+            chunk_size (int): The maximum number of points generated at once.
+            progress_callback (callable, optional): Called with the completed fraction (0 to 1).
+            num_ticks (int): The maximum number of times `progress_callback` is called.
+            metrics (RenderMetrics, optional): Collects the "fern density" stage timing and the point count.
+            workers (int): The number of worker processes running the chaos game. With more than one, every
+                worker adds its hits into its own histogram in shared memory and the histograms are summed.
+
+        Returns:
+            np.ndarray: The (height, width) hit counts over `bounds`, row 0 at the top.
+        """
+        if workers > 1:
+            memory = shared_memory.SharedMemory(create=True, size=workers * height * width * 8)
+            try:
+                np.ndarray((workers, height * width), dtype=np.int64, buffer=memory.buf)[:] = 0
+                state = {'memory_name': memory.name, 'workers': workers, 'width': width, 'height': height,
+                         'chunk_size': chunk_size}
+                self.run_shards(density_shard, n, workers, state, progress_callback, num_ticks)
+                counts = np.ndarray((workers, height * width), dtype=np.int64, buffer=memory.buf).sum(axis=0)
+            finally:
+                memory.close()
+                memory.unlink()
+        else:
+            counts = np.zeros(height * width, dtype=np.int64)
+            self.count_hits(counts, n, width, height, chunk_size, progress_callback, num_ticks)
+        if metrics is not None:
+            metrics.split("fern density")
+            metrics.count("fern_points", n)
+        return counts.reshape(height, width)
+
+
+def make_ifs(canvas_shape, definition=None, **kwargs):
+    """
+    Create the chaos-game generator of a preset canvas shape or of a user-supplied definition.
+
+    Args:
+        canvas_shape (str): A key of `IFS_PRESETS`, or `CUSTOM_IFS` to use `definition`.
+        definition (dict or str, optional): The user definition for `CUSTOM_IFS`, see `parse_ifs`.
+        **kwargs: Passed on to `IteratedFunctionSystem`, e.g. the seed.
+
+    Returns:
+        IteratedFunctionSystem: The generator.
+
+    Raises:
+        ValueError: If the shape is unknown or the definition is missing or malformed.
+    """
+    if canvas_shape == CUSTOM_IFS:
+        if definition is None:
+            raise ValueError(f"the {CUSTOM_IFS} canvas shape needs an IFS definition")
+    elif canvas_shape in IFS_PRESETS:
+        definition = IFS_PRESETS[canvas_shape]
+    else:
+        raise ValueError(f"Unknown IFS canvas shape: {canvas_shape}")
+    return IteratedFunctionSystem(*parse_ifs(definition), **kwargs)
+
+
+def init_worker(state, next_plane):
+    """
+    Attach a shard worker to the shared memory and claim its own histogram plane.
+
+    Args:
+        state (dict): The name of the shared memory and the shape of what it holds.
+        next_plane (multiprocessing.Value): The next histogram plane nobody has claimed.
+    """
+    worker_state.update(state)
+    worker_state['memory'] = shared_memory.SharedMemory(name=state['memory_name'])
+    with next_plane.get_lock():
+        worker_state['plane'] = next_plane.value
+        next_plane.value += 1
+
+
+def points_shard(task):
+    """
+    Write the points of one shard into their slice of the shared (2, n) point array.
+
+    Args:
+        task (tuple): The generator, the index of the first point and the number of points.
+    """
+    fern, start, count = task
+    points = np.ndarray((2, worker_state['n']), buffer=worker_state['memory'].buf)
+    # chunked, so a shard never holds more than one chunk of its points besides the shared array
+    for x, y in fern.iterate_points(count, 2 ** 20):
+        points[:, start:start + len(x)] = x, y
+        start += len(x)
+
+
+def density_shard(task):
+    """
+    Add the pixel hits of one shard to the histogram plane of this worker.
+
+    Args:
+        task (tuple): The generator, the index of the first point and the number of points.
+    """
+    fern, _, count = task
+    width, height = worker_state['width'], worker_state['height']
+    planes = np.ndarray((worker_state['workers'], height * width), dtype=np.int64, buffer=worker_state['memory'].buf)
+    fern.count_hits(planes[worker_state['plane']], count, width, height, worker_state['chunk_size'])
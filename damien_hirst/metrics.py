@@ -0,0 +1,121 @@
+import json
+import logging
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# callables notified with the metrics dict of every finished render
+subscribers = []
+
+
+class RenderMetrics:
+    """
+    Named stage timers and counters of one render.
+
+    Stages are timed as consecutive splits of a single stopwatch: `split(stage)` charges the time since
+    the previous split to `stage`, so the stages of a render add up to its total time and code passing the
+    same object down (e.g. to the fern) never counts a second twice.
+
+    Attributes:
+        stages (dict): The seconds spent per stage, in the order the stages first finished.
+        counters (dict): Named counts and gauges, e.g. dots drawn or bytes encoded.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.start = self.last_split = time.perf_counter()
+
+    def split(self, stage):
+        """
+        Charge the time since the previous split to `stage`.
+
+        Args:
+            stage (str): The name of the stage that just finished.
+        """
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.last_split
+        self.last_split = now
+
+    def count(self, name, value=1):
+        """
+        Add `value` to a counter.
+
+        Args:
+            name (str): The name of the counter.
+            value (int): The amount to add.
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self):
+        """
+        Summarize the metrics up to the last split.
+
+        Returns:
+            dict: The total seconds, the seconds per stage and the counters, ready for JSON.
+        """
+        return {"total_seconds": self.last_split - self.start, "stages": dict(self.stages),
+                "counters": dict(self.counters)}
+
+
+def peak_memory_bytes():
+    """
+    Read the peak resident memory of the process so far.
+
+    Returns:
+        int or None: The peak resident memory in bytes, or None where it cannot be read.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def subscribe(callback):
+    """
+    Call `callback` with the metrics dict of every finished render; usable as a decorator.
+
+    Args:
+        callback (callable): Called with one dict, see `publish`.
+
+    Returns:
+        callable: The callback.
+    """
+    subscribers.append(callback)
+    return callback
+
+
+def unsubscribe(callback):
+    """
+    Stop calling a callback registered with `subscribe`.
+
+    Args:
+        callback (callable): The callback to remove.
+    """
+    subscribers.remove(callback)
+
+
+def publish(metrics, event, **fields):
+    """
+    Log the metrics of a finished render as one JSON line and pass them to every subscriber.
+
+    Args:
+        metrics (RenderMetrics): The metrics to publish.
+        event (str): What finished, e.g. "render" or "app render".
+        **fields: Extra context included in the record, e.g. the canvas shape.
+    """
+    record = dict(event=event, **fields, **metrics.as_dict())
+    logger.info(json.dumps(record, default=str))
+    for callback in list(subscribers):
+        try:
+            callback(record)
+        except Exception:
+            # monitoring must never break a render
+            logger.exception("metrics subscriber %r failed", callback)
@@ -0,0 +1,367 @@
+import gzip
+import weakref
+import numpy as np
+from io import BytesIO
+from PIL import Image
+from matplotlib import rc_context
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from animation import write_animation
+from ifs import IFS_SHAPES, make_ifs
+from metrics import RenderMetrics, peak_memory_bytes, publish
+from poisson_disk import cull_overlaps, poisson_disk_samples
+from raster_backend import INDEXED_FORMATS, blend_palette, gradient_palette, render_dots, save_image, tone_map
+from svg_writer import write_svg
+
+# number of progress updates per painting, independent of the number of dots
+PROGRESS_TICKS = 20
+
+# canvas shapes laid out on a grid, circles or spirals; the IFS shapes come from `ifs.IFS_SHAPES`
+CANVAS_LAYOUTS = ["square", "circle1", "circle2", "golden ratio", "scatter"]
+
+# the matplotlib marker of every dot shape
+DOT_MARKERS = {
+    "circle": 'o',
+    "square": 's',
+    "triangle": '^',
+    "pentagon": 'p',
+    "hexagon": 'H',
+    "diamond": 'D'
+}
+
+# file extension of every image format
+FILE_EXTENSIONS = {"SVG": "svg", "SVGZ": "svgz", "JPEG": "jpeg", "PNG": "png", "WEBP": "webp"}
+
+# figures not yet reclaimed, to report how many are alive
+live_figures = weakref.WeakSet()
+
+
+def output_format(canvas_shape, fern_mode, image_format):
+    """
+    Find the format `render_painting` actually encodes, since the density fern is never an SVG.
+
+    Args:
+        canvas_shape (str): The shape of the canvas.
+        fern_mode (str): How the IFS shapes are drawn, either "Points" or "Density".
+        image_format (str): The image format asked for.
+
+    Returns:
+        str: The image format of the rendered bytes, "JPEG" for a density fern asked for as SVG or SVGZ.
+    """
+    if canvas_shape in IFS_SHAPES and fern_mode == "Density" and image_format in ("SVG", "SVGZ"):
+        return "JPEG"
+    return image_format
+
+
+def pick_colors(color_list, count, rng):
+    """
+    Pick a random color from the palette for each of `count` dots with a single index draw.
+
+    Args:
+        color_list (np.ndarray): The (N, 4) RGBA colors to pick from, as returned by `get_color_list`.
+        count (int): The number of dots to pick a color for.
+        rng (np.random.Generator): The random generator to draw from.
+
+    Returns:
+        np.ndarray: The (count, 4) picked RGBA colors, one row per dot.
+    """
+    return np.asarray(color_list)[rng.integers(len(color_list), size=count)]
+
+
+def layout_painting(color_list, dot_size, gap_size, canvas_size, canvas_shape, shape, figsize_ratio=1.0, n=1000,
+                    cull=False, rng=None, progress_callback=None, metrics=None, fern_workers=1,
+                    ifs_definition=None):
+    """
+    Lay out the dots of a painting and pick a color for each.
+
+    Args:
+        color_list (np.ndarray): The (N, 4) RGBA colors to pick from, as returned by `get_color_list`.
+        dot_size (int): The size of each dot in the painting.
+        gap_size (int): The gap size between dots.
+        canvas_size (int): The size of the canvas where dots will be painted.
+        canvas_shape (str): The shape of the canvas.
+        shape (str): The shape of individual dots (e.g., circle, square).
+        figsize_ratio (float): The ratio to adjust the figure size.
+        n (int): The number of points in the Barnsley fern or other IFS shape.
+        cull (bool): Whether to drop the dots of the ring layouts closer than `gap_size` to an earlier dot.
+        rng (np.random.Generator, optional): The generator every random pick comes from.
+        progress_callback (callable, optional): Called with the completed fraction of the fern.
+        metrics (RenderMetrics, optional): Collects the stage timings and counters.
+        fern_workers (int): The number of worker processes running the chaos game of the IFS shapes.
+        ifs_definition (str, optional): The JSON definition of the "custom IFS" canvas shape, see `parse_ifs`.
+
+    Returns:
+        tuple: The x and y coordinates and colors of the dots, the marker size and marker, the figure
+            size in inches and whether the axes use an equal aspect ratio.
+    """
+    rng = np.random.default_rng(rng)
+    if metrics is None:
+        metrics = RenderMetrics()
+
+    # Calculate the actual figsize using the given ratio
+    figsize = canvas_size / 100 * figsize_ratio
+
+    # Set the aspect ratio to be equal so the dots are round
+    equal_aspect = True
+
+    # Calculate the number of rows and columns in the grid based on canvas size and gap size
+    rows = int(canvas_size / gap_size)
+    cols = int(canvas_size / gap_size)
+
+    # Define the marker shape based on the selected shape
+    marker = DOT_MARKERS.get(shape, 'o')  # Default to circle if shape is not recognized
+    marker_size = dot_size
+
+    x = y = np.empty(0)
+    if canvas_shape == "square":
+        # one dot per grid cell, laid out row by row
+        grid_x, grid_y = np.meshgrid(np.arange(cols) * gap_size, np.arange(rows) * gap_size)
+        x = grid_x.ravel()
+        y = grid_y.ravel()
+
+    elif canvas_shape == "circle1":
+        # Calculate the number of dots to evenly distribute within the circle
+        circle_radius = min(canvas_size, canvas_size) / 2
+        num_circles = int(circle_radius / gap_size)  # Number of circles to draw
+        num_dots_per_circle = 50  # Increase the number of dots for a fuller circle
+
+        # one row per circle, the radius increases for each circle
+        radius = (np.arange(num_circles) + 1)[:, np.newaxis] * gap_size
+        theta = np.linspace(0, 2 * np.pi, num_dots_per_circle)
+        x = (radius * np.cos(theta) + canvas_size / 2).ravel()
+        y = (radius * np.sin(theta) + canvas_size / 2).ravel()
+
+    elif canvas_shape == "circle2":
+        # Calculate the number of dots to evenly distribute within the circle
+        circle_radius = min(canvas_size, canvas_size) / 2
+
+        # Calculate the number of circles based on the gap size
+        num_circles = int(circle_radius / gap_size)  # Number of circles to draw
+
+        # circle i holds 7 * (i + 1) dots, spread from 0 to 2 pi (inclusive)
+        dots_per_circle = 7 * (np.arange(num_circles) + 1)
+        circle = np.repeat(np.arange(num_circles), dots_per_circle)
+        position = np.arange(len(circle)) - np.repeat(np.cumsum(dots_per_circle) - dots_per_circle, dots_per_circle)
+        theta = 2 * np.pi * position / (dots_per_circle[circle] - 1)
+        radius = (circle + 1) * gap_size
+
+        # Add a single dot in the center, followed by the circles
+        x = np.concatenate([[0.0], radius * np.cos(theta)]) + canvas_size / 2
+        y = np.concatenate([[0.0], radius * np.sin(theta)]) + canvas_size / 2
+
+    elif canvas_shape == "golden ratio":
+        # Adjust the number of dots based on gap_size
+        num_dots = int(2 * np.pi * (canvas_size / 2) / gap_size)
+        # phi = (1 + np.sqrt(5)) / 2  # Golden ratio
+
+        angles = np.linspace(0, 2 * np.pi * num_dots, num_dots)
+        radii = np.sqrt(1.0 * np.arange(num_dots)) / np.sqrt(num_dots)
+        x = radii * np.cos(angles) * canvas_size / 2 + canvas_size / 2
+        y = radii * np.sin(angles) * canvas_size / 2 + canvas_size / 2
+
+    elif canvas_shape == "scatter":
+        # random dots over the canvas, no two closer than the gap size
+        x, y = poisson_disk_samples(canvas_size, canvas_size, gap_size, rng)
+
+    if cull and canvas_shape in ("circle1", "circle2"):
+        # the rings hold more dots than fit near the center, and circle1 repeats the dot at 0 and 2 pi
+        keep = cull_overlaps(x, y, gap_size)
+        metrics.count("dots_culled", int(len(x) - np.count_nonzero(keep)))
+        x, y = x[keep], y[keep]
+
+    metrics.split("geometry")
+    if canvas_shape in IFS_SHAPES:
+        x, y, colors = make_ifs(canvas_shape, ifs_definition, seed=rng).draw_points(
+            n, color_list, progress_callback=progress_callback, num_ticks=PROGRESS_TICKS, metrics=metrics,
+            workers=fern_workers)
+        figsize = 5
+        # the fern fills the square figure as it always has, the other attractors keep their proportions
+        equal_aspect = canvas_shape != "barnsley fern"
+        marker = 'o'
+        marker_size = 1
+
+    else:
+        colors = pick_colors(color_list, len(x), rng)
+        metrics.split("colors")
+    metrics.count("dots", len(x))
+    return x, y, colors, marker_size, marker, figsize, equal_aspect
+
+
+def render_painting(color_list, dot_size, gap_size, canvas_size, canvas_shape, shape, dpi, figsize_ratio=1.0,
+                    image_format="SVG", renderer="Direct", fern_mode="Points", n=1000, seed=0, cull=False,
+                    progress_callback=None, metrics=None, fern_workers=1, ifs_definition=None, compress_level=6):
+    """
+    Render a dot painting and return the encoded image.
+
+    Every random pick comes from a generator seeded with `seed`, so identical parameters give identical
+    bytes. Nothing here depends on a Streamlit session, so paintings can be rendered from scripts and
+    worker processes as well as from the app.
+
+    Args:
+        color_list (np.ndarray): The (N, 4) RGBA colors to pick from, as returned by `get_color_list`.
+        dot_size (int): The size of each dot in the painting.
+        gap_size (int): The gap size between dots.
+        canvas_size (int): The size of the canvas where dots will be painted.
+        canvas_shape (str): The shape of the canvas.
+        shape (str): The shape of individual dots (e.g., circle, square).
+        dpi (int): The resolution for JPEG, PNG and WebP images.
+        figsize_ratio (float): The ratio to adjust the figure size.
+        image_format (str): The image format for saving (SVG, SVGZ, JPEG, PNG, which is 8-bit palette-indexed
+            on white plus blends of the palette colors or on the density gradient, or lossless WEBP).
+        renderer (str): Either "Direct" (NumPy rasterizer or compact SVG writer) or "Matplotlib".
+        fern_mode (str): How the Barnsley fern and the other IFS shapes are drawn, either "Points" or
+            "Density" (a JPEG unless PNG or WEBP is asked for).
+        n (int): The number of points in the Barnsley fern or other IFS shape.
+        seed (int): The seed of the random generator.
+        cull (bool): Whether to drop the dots of the ring layouts closer than `gap_size` to an earlier dot.
+        progress_callback (callable, optional): Called with the completed fraction of the fern, or of the
+            dots rasterized for the other shapes, and once more before encoding.
+        metrics (RenderMetrics, optional): Collects the stage timings and counters. When omitted, the
+            render collects and publishes its own.
+        fern_workers (int): The number of worker processes running the chaos game of the IFS shapes; the
+            result is identical for the same seed and number of workers.
+        ifs_definition (str, optional): The JSON definition of the "custom IFS" canvas shape, see `parse_ifs`.
+        compress_level (int): The PNG and WebP compression effort, from 0 (fastest) to 9 (smallest).
+
+    Returns:
+        bytes: The encoded SVG, SVGZ, JPEG, PNG or WebP image.
+    """
+    publish_metrics = metrics is None
+    if publish_metrics:
+        metrics = RenderMetrics()
+    rng = np.random.default_rng(seed)
+
+    if canvas_shape in IFS_SHAPES and fern_mode == "Density":
+        # accumulate hits per output pixel instead of keeping every point, the attractor keeps its aspect ratio
+        blf = make_ifs(canvas_shape, ifs_definition, seed=rng)
+        x_min, x_max, y_min, y_max = blf.bounds
+        height = 5 * dpi
+        width = max(1, int(height * (x_max - x_min) / (y_max - y_min)))
+        counts = blf.draw_density(n, width, height, progress_callback=progress_callback,
+                                  num_ticks=PROGRESS_TICKS, metrics=metrics, workers=fern_workers)
+        image = tone_map(counts, color_list)
+        palette = gradient_palette(color_list)
+        metrics.split("tone map")
+    else:
+        x, y, colors, marker_size, marker, figsize, equal_aspect = layout_painting(
+            color_list, dot_size, gap_size, canvas_size, canvas_shape, shape, figsize_ratio, n, cull, rng,
+            progress_callback, metrics, fern_workers, ifs_definition)
+        image = None
+        palette = blend_palette(color_list)
+
+    buffer = BytesIO()
+    if image is None and image_format in ("JPEG",) + INDEXED_FORMATS and renderer == "Direct":
+        # stamp the dots straight into a pixel buffer, no matplotlib figure involved
+        def rasterize_progress(fraction):
+            # the chaos game already reported the progress of the IFS shapes, the rasterizer only gives the
+            # caller a chance to stop
+            progress_callback(1.0 if canvas_shape in IFS_SHAPES else fraction)
+
+        image = render_dots(x, y, colors, marker_size, marker, figsize, dpi, equal_aspect,
+                            rasterize_progress if progress_callback is not None else None)
+        metrics.split("rasterize")
+
+    if progress_callback is not None:
+        progress_callback(1.0)
+    if image is not None:
+        save_image(image, buffer, image_format if image_format in INDEXED_FORMATS else "JPEG", dpi, palette,
+                   compress_level)
+    elif image_format in ("SVG", "SVGZ") and renderer == "Direct":
+        # define the marker once and place every dot with a <use> element
+        write_svg(buffer, x, y, colors, marker_size, marker, figsize, equal_aspect, compress=image_format == "SVGZ")
+    else:
+        # Create a figure and axis; the figure is not registered with pyplot, so nothing keeps it
+        # alive once it is encoded
+        fig = Figure(figsize=(figsize, figsize))
+        FigureCanvasAgg(fig)
+        live_figures.add(fig)
+        ax = fig.subplots()
+        if equal_aspect:
+            ax.set_aspect('equal')
+
+        # Turn off the axis
+        ax.axis('off')
+
+        # draw the whole painting as a single collection
+        ax.scatter(x, y, c=colors, s=marker_size, marker=marker)
+        metrics.split("artists")
+
+        try:
+            if image_format in ("SVG", "SVGZ"):
+                # Create an SVG image; without a date and with a fixed id salt the same painting gives the same
+                # bytes, and gzip it here with a fixed timestamp for the same reason
+                with rc_context({'svg.hashsalt': 'dot-painting'}):
+                    if image_format == "SVGZ":
+                        with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as gzip_stream:
+                            fig.savefig(gzip_stream, format="svg", bbox_inches='tight', metadata={'Date': None})
+                    else:
+                        fig.savefig(buffer, format="svg", bbox_inches='tight', metadata={'Date': None})
+            elif image_format in INDEXED_FORMATS:
+                # re-encode the PNG matplotlib writes, like the images of the Direct renderer
+                rendered = BytesIO()
+                fig.savefig(rendered, format="png", bbox_inches='tight', dpi=dpi)
+                save_image(np.asarray(Image.open(rendered).convert("RGB")), buffer, image_format, dpi, palette,
+                           compress_level)
+            else:
+                # Create a JPEG image
+                fig.savefig(buffer, format="jpeg", bbox_inches='tight', dpi=dpi)  # Use 'tight' to remove excess white space
+        finally:
+            # drop the artists and their data now instead of waiting for the garbage collector to reclaim the figure
+            fig.clear()
+
+    metrics.split("encode")
+    painting = buffer.getvalue()
+    metrics.count("bytes_encoded", len(painting))
+    metrics.counters["figures_alive"] = len(live_figures)
+    metrics.counters["peak_memory_bytes"] = peak_memory_bytes()
+    if publish_metrics:
+        publish(metrics, "render", canvas_shape=canvas_shape, image_format=image_format, renderer=renderer)
+    return painting
+
+
+def render_animation(color_list, dot_size, gap_size, canvas_size, canvas_shape, shape, dpi, figsize_ratio=1.0,
+                     image_format="GIF", n=1000, seed=0, cull=False, num_frames=100, fps=25, progress_callback=None,
+                     ifs_definition=None):
+    """
+    Render a dot painting growing dot by dot as an animated GIF or MP4.
+
+    The dots appear in the order they are laid out: the golden ratio spiral grows outwards and the
+    Barnsley fern and the other IFS shapes fill in. The last frame matches the JPEG of the same parameters
+    and seed.
+
+    Args:
+        color_list (np.ndarray): The (N, 4) RGBA colors to pick from, as returned by `get_color_list`.
+        dot_size (int): The size of each dot in the painting.
+        gap_size (int): The gap size between dots.
+        canvas_size (int): The size of the canvas where dots will be painted.
+        canvas_shape (str): The shape of the canvas.
+        shape (str): The shape of individual dots (e.g., circle, square).
+        dpi (int): The resolution of the frames.
+        figsize_ratio (float): The ratio to adjust the figure size.
+        image_format (str): Either "GIF" or "MP4".
+        n (int): The number of points in the Barnsley fern or other IFS shape.
+        seed (int): The seed of the random generator.
+        cull (bool): Whether to drop the dots of the ring layouts closer than `gap_size` to an earlier dot.
+        num_frames (int): The number of frames.
+        fps (float): The number of frames per second.
+        progress_callback (callable, optional): Called with the completed fraction of the fern, or of the
+            frames encoded for the other shapes.
+        ifs_definition (str, optional): The JSON definition of the "custom IFS" canvas shape, see `parse_ifs`.
+
+    Returns:
+        bytes: The encoded animation.
+    """
+    rng = np.random.default_rng(seed)
+    x, y, colors, marker_size, marker, figsize, equal_aspect = layout_painting(
+        color_list, dot_size, gap_size, canvas_size, canvas_shape, shape, figsize_ratio, n, cull, rng,
+        progress_callback, ifs_definition=ifs_definition)
+
+    def frame_progress(fraction):
+        # as in `render_painting`, the IFS shapes already reported their progress, the frames only give the
+        # caller a chance to stop
+        progress_callback(1.0 if canvas_shape in IFS_SHAPES else fraction)
+
+    buffer = BytesIO()
+    write_animation(buffer, x, y, colors, marker_size, marker, figsize, dpi, equal_aspect, num_frames, fps,
+                    image_format, frame_progress if progress_callback is not None else None)
+    return buffer.getvalue()
@@ -0,0 +1,98 @@
+import numpy as np
+
+# number of darts thrown at every empty grid cell
+ATTEMPTS = 30
+
+# cells of the same phase are three cells apart, far enough that their darts never conflict
+PHASES = [(row, col) for row in range(3) for col in range(3)]
+
+# the cells within two cells of a sample can hold a point closer than the minimum distance
+NEIGHBOR_OFFSETS = [(row, col) for row in range(-2, 3) for col in range(-2, 3) if (row, col) != (0, 0)]
+
+
+def poisson_disk_samples(width, height, min_distance, rng, attempts=ATTEMPTS):
+    """
+    Scatter points over a rectangle, no two closer than `min_distance`.
+
+    Like Bridson's algorithm, the sampler keeps a background grid of cells `min_distance / sqrt(2)` wide,
+    so a cell holds at most one point and a candidate is only checked against the 24 cells around it.
+    Instead of growing from active points one at a time, every empty cell of a phase gets a dart at once:
+    cells of the same phase are three cells apart, so their darts never conflict and a whole phase is a
+    handful of vectorized operations. Each round visits the nine phases, and `attempts` rounds leave the
+    rectangle close to maximally covered in time linear in the number of cells.
+
+    Args:
+        width (float): The width of the rectangle, which starts at 0.
+        height (float): The height of the rectangle, which starts at 0.
+        min_distance (float): The minimum distance between two points.
+        rng (np.random.Generator): The random generator to draw from.
+        attempts (int): The number of darts thrown at every empty cell.
+
+    Returns:
+        tuple: The x and y coordinates of the points, ordered row by row of the grid.
+    """
+    cell_size = min_distance / np.sqrt(2)
+    # every phase covers the same (phase_rows, phase_cols) block of cells; the cells past the rectangle
+    # never accept a dart
+    phase_rows = int(np.ceil(height / cell_size / 3))
+    phase_cols = int(np.ceil(width / cell_size / 3))
+    # the grid holds the point of every cell (NaN while empty), padded by two empty cells on every side
+    grid_x = np.full((3 * phase_rows + 4, 3 * phase_cols + 4), np.nan)
+    grid_y = np.full_like(grid_x, np.nan)
+    cell_rows = np.arange(phase_rows)[:, np.newaxis] * 3
+    cell_cols = np.arange(phase_cols) * 3
+    min_distance_squared = min_distance ** 2
+
+    def phase_view(grid, row, col):
+        # the cells of a phase shifted by (row, col), as a strided view instead of a gather
+        return grid[2 + row:2 + row + 3 * phase_rows:3, 2 + col:2 + col + 3 * phase_cols:3]
+
+    for _ in range(attempts):
+        for phase_row, phase_col in PHASES:
+            empty = np.isnan(phase_view(grid_x, phase_row, phase_col))
+            if not empty.any():
+                continue
+
+            # one uniform dart inside every cell of the phase, kept in empty cells on the rectangle
+            x = (cell_cols + phase_col + rng.random(empty.shape)) * cell_size
+            y = (cell_rows + phase_row + rng.random(empty.shape)) * cell_size
+            accept = empty & (x < width) & (y < height)
+            for row_offset, col_offset in NEIGHBOR_OFFSETS:
+                neighbor_x = phase_view(grid_x, phase_row + row_offset, phase_col + col_offset)
+                neighbor_y = phase_view(grid_y, phase_row + row_offset, phase_col + col_offset)
+                # comparisons with an empty (NaN) neighbor are False, so they never reject
+                accept &= ~((x - neighbor_x) ** 2 + (y - neighbor_y) ** 2 < min_distance_squared)
+            phase_view(grid_x, phase_row, phase_col)[accept] = x[accept]
+            phase_view(grid_y, phase_row, phase_col)[accept] = y[accept]
+
+    filled = ~np.isnan(grid_x)
+    return grid_x[filled], grid_y[filled]
+
+
+def cull_overlaps(x, y, min_distance):
+    """
+    Drop every dot closer than `min_distance` to a dot drawn before it.
+
+    Dots are bucketed into a grid of `min_distance` wide cells, so each dot is only compared with the
+    kept dots in the 3 x 3 cells around it.
+
+    Args:
+        x (np.ndarray): The x coordinates of the dots, in drawing order.
+        y (np.ndarray): The y coordinates of the dots, in drawing order.
+        min_distance (float): The minimum distance between two kept dots.
+
+    Returns:
+        np.ndarray: A boolean mask of the dots to keep.
+    """
+    keep = np.zeros(len(x), dtype=bool)
+    cells = {}
+    cell_rows = np.floor(np.asarray(y) / min_distance).astype(int)
+    cell_cols = np.floor(np.asarray(x) / min_distance).astype(int)
+    min_distance_squared = min_distance ** 2
+    for index, (px, py, row, col) in enumerate(zip(x, y, cell_rows, cell_cols)):
+        neighbors = [other for row_offset in (-1, 0, 1) for col_offset in (-1, 0, 1)
+                     for other in cells.get((row + row_offset, col + col_offset), ())]
+        if all((px - x[other]) ** 2 + (py - y[other]) ** 2 >= min_distance_squared for other in neighbors):
+            keep[index] = True
+            cells.setdefault((row, col), []).append(index)
+    return keep
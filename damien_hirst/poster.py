@@ -0,0 +1,346 @@
+"""
+Render poster-size dot paintings tile by tile.
+
+The image is split into square tiles and only the dots whose marker overlaps a tile are stamped into
+it, found through a bucket index of dots per tile. Tiles are written straight into a memory-mapped
+uncompressed TIFF, or into a memory-mapped scratch file that is then streamed into a PNG row by row,
+so peak memory depends on the tile size and not on the size of the print:
+
+    python poster.py --palette Viridis --canvas-shape "golden ratio" --canvas-size 800 --dpi 1200 \
+        --workers 8 --output print.tiff
+"""
+import argparse
+import multiprocessing
+import os
+import struct
+import tempfile
+import zlib
+
+import numpy as np
+from matplotlib.colors import to_rgba_array
+
+from color_options import get_color_list
+from painting import layout_painting
+from raster_backend import image_layout, marker_mask, stamp_dots
+
+# width and height of a tile in pixels
+TILE_SIZE = 2048
+
+# rows per TIFF strip and per compressed PNG block
+ROWS_PER_STRIP = 64
+
+# the offsets of a classic TIFF are 32 bit
+MAX_TIFF_BYTES = 2 ** 32 - 1
+
+# state shared with the tile workers, set once per process by `init_worker`
+worker_state = {}
+
+
+def tile_index(cols, rows, half_size, tile_size, num_tile_cols, num_tile_rows):
+    """
+    Bucket the dots by the tiles their marker overlaps.
+
+    A dot whose marker straddles a tile border is listed in every tile it touches. Within a tile the dots
+    keep their drawing order.
+
+    Args:
+        cols (np.ndarray): The integer column of every dot center.
+        rows (np.ndarray): The integer row of every dot center.
+        half_size (int): Half the size of the marker mask, in pixels.
+        tile_size (int): The width and height of a tile in pixels.
+        num_tile_cols (int): The number of tile columns.
+        num_tile_rows (int): The number of tile rows.
+
+    Returns:
+        tuple: The dot indices sorted by tile, and the offsets where the dots of each tile start
+            (one more than the number of tiles), so tile `t` holds `dots[starts[t]:starts[t + 1]]`.
+    """
+    first_col = np.maximum((cols - half_size) // tile_size, 0)
+    last_col = np.minimum((cols + half_size) // tile_size, num_tile_cols - 1)
+    first_row = np.maximum((rows - half_size) // tile_size, 0)
+    last_row = np.minimum((rows + half_size) // tile_size, num_tile_rows - 1)
+    span_cols = np.maximum(last_col - first_col + 1, 0)
+    span_rows = np.maximum(last_row - first_row + 1, 0)
+
+    # one entry per (dot, tile) pair
+    count = span_cols * span_rows
+    dot = np.repeat(np.arange(len(cols)), count)
+    position = np.arange(len(dot)) - np.repeat(np.cumsum(count) - count, count)
+    tile = ((first_row[dot] + position // span_cols[dot]) * num_tile_cols
+            + first_col[dot] + position % span_cols[dot])
+
+    order = np.argsort(tile, kind='stable')
+    starts = np.searchsorted(tile[order], np.arange(num_tile_cols * num_tile_rows + 1))
+    return dot[order], starts
+
+
+def tiff_header(width, height, dpi):
+    """
+    Build the header of a baseline, uncompressed RGB TIFF whose pixels follow it contiguously.
+
+    Args:
+        width (int): The image width in pixels.
+        height (int): The image height in pixels.
+        dpi (int): The resolution stored in the image metadata.
+
+    Returns:
+        bytes: The header; the pixel rows start right after it.
+    """
+    num_strips = -(-height // ROWS_PER_STRIP)
+    strip_bytes = ROWS_PER_STRIP * width * 3
+    num_entries = 13
+    ifd_size = 2 + 12 * num_entries + 4
+    # out-of-line values: bits per sample, two resolutions, strip offsets and strip byte counts
+    bits_offset = 8 + ifd_size
+    resolution_offset = bits_offset + 6
+    offsets_offset = resolution_offset + 16
+    counts_offset = offsets_offset + 4 * num_strips
+    data_offset = counts_offset + 4 * num_strips
+    if data_offset + width * height * 3 > MAX_TIFF_BYTES:
+        raise ValueError(f"A {width}x{height} image does not fit in a TIFF file, use a lower DPI")
+
+    SHORT, LONG, RATIONAL = 3, 4, 5
+    entries = [
+        (256, LONG, 1, width),  # image width
+        (257, LONG, 1, height),  # image length
+        (258, SHORT, 3, bits_offset),  # bits per sample
+        (259, SHORT, 1, 1),  # no compression
+        (262, SHORT, 1, 2),  # RGB
+        (273, LONG, num_strips, offsets_offset if num_strips > 1 else data_offset),  # strip offsets
+        (277, SHORT, 1, 3),  # samples per pixel
+        (278, LONG, 1, ROWS_PER_STRIP),  # rows per strip
+        (279, LONG, num_strips, counts_offset if num_strips > 1 else width * height * 3),  # strip byte counts
+        (282, RATIONAL, 1, resolution_offset),  # x resolution
+        (283, RATIONAL, 1, resolution_offset + 8),  # y resolution
+        (284, SHORT, 1, 1),  # chunky planar configuration
+        (296, SHORT, 1, 2),  # resolution in inches
+    ]
+    header = [b'II*\x00', struct.pack('<I', 8), struct.pack('<H', num_entries)]
+    for tag, field_type, count, value in entries:
+        value_format = '<HH' if field_type == SHORT and count == 1 else '<I'
+        value_bytes = struct.pack(value_format, value, 0) if value_format == '<HH' else struct.pack('<I', value)
+        header.append(struct.pack('<HHI', tag, field_type, count) + value_bytes)
+    header.append(struct.pack('<I', 0))  # no further images
+    header.append(struct.pack('<3H', 8, 8, 8))
+    header.append(struct.pack('<4I', dpi, 1, dpi, 1))
+
+    strip_offsets = data_offset + strip_bytes * np.arange(num_strips)
+    strip_counts = np.minimum(strip_bytes, width * height * 3 - strip_bytes * np.arange(num_strips))
+    header.append(strip_offsets.astype('<u4').tobytes())
+    header.append(strip_counts.astype('<u4').tobytes())
+    return b''.join(header)
+
+
+def read_rows(path, width, height):
+    """
+    Read a raw RGB image from a file a block of rows at a time.
+
+    Args:
+        path (str): The file holding the rows back to back, 3 bytes per pixel.
+        width (int): The image width in pixels.
+        height (int): The image height in pixels.
+
+    Yields:
+        np.ndarray: The next (ROWS_PER_STRIP, W, 3) uint8 block, shorter at the bottom.
+    """
+    with open(path, 'rb') as file:
+        for start in range(0, height, ROWS_PER_STRIP):
+            num_rows = min(ROWS_PER_STRIP, height - start)
+            yield np.fromfile(file, dtype=np.uint8, count=num_rows * width * 3).reshape(num_rows, width, 3)
+
+
+def write_png(path, blocks, width, height, dpi):
+    """
+    Encode an image into a PNG file a block of rows at a time, without holding it in memory.
+
+    Args:
+        path (str): The PNG file to write.
+        blocks (iterable): The (rows, W, 3) uint8 blocks of the image, top to bottom.
+        width (int): The image width in pixels.
+        height (int): The image height in pixels.
+        dpi (int): The resolution stored in the image metadata.
+    """
+    def chunk(chunk_type, data):
+        return (struct.pack('>I', len(data)) + chunk_type + data
+                + struct.pack('>I', zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+
+    pixels_per_meter = int(round(dpi / 0.0254))
+    compressor = zlib.compressobj(6)
+    with open(path, 'wb') as file:
+        file.write(b'\x89PNG\r\n\x1a\n')
+        file.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        file.write(chunk(b'pHYs', struct.pack('>IIB', pixels_per_meter, pixels_per_meter, 1)))
+        for block in blocks:
+            rows = block.reshape(-1, width * 3)
+            # "Sub" filter: every byte minus the same channel of the pixel to its left
+            filtered = np.empty((len(rows), width * 3 + 1), dtype=np.uint8)
+            filtered[:, 0] = 1
+            filtered[:, 1:4] = rows[:, :3]
+            np.subtract(rows[:, 3:], rows[:, :-3], out=filtered[:, 4:])
+            data = compressor.compress(filtered.tobytes())
+            if data:
+                file.write(chunk(b'IDAT', data))
+        file.write(chunk(b'IDAT', compressor.flush()))
+        file.write(chunk(b'IEND', b''))
+
+
+def init_worker(state):
+    worker_state.update(state)
+
+
+def render_tile(tile):
+    """
+    Render one tile into the memory-mapped output image, run inside a worker process or inline.
+
+    Args:
+        tile (int): The tile number, row by row.
+
+    Returns:
+        int: The number of dots stamped into the tile.
+    """
+    state = worker_state
+    image = np.memmap(state['path'], dtype=np.uint8, mode='r+', offset=state['offset'],
+                      shape=(state['height'], state['width'], 3))
+    tile_size, mask = state['tile_size'], state['mask']
+    half_size = mask.shape[0] // 2
+    tile_row, tile_col = divmod(tile, state['num_tile_cols'])
+    top, left = tile_row * tile_size, tile_col * tile_size
+    bottom, right = min(top + tile_size, state['height']), min(left + tile_size, state['width'])
+
+    # grow the tile by a whole mask on every side, so every stamp of a dot overlapping the tile fits
+    margin = 2 * half_size
+    canvas = np.full((bottom - top + 2 * margin, right - left + 2 * margin, 3), 255, dtype=np.uint8)
+    dots = state['dots'][state['starts'][tile]:state['starts'][tile + 1]]
+    if len(dots):
+        stamp_dots(canvas, state['cols'][dots] - left + margin, state['rows'][dots] - top + margin,
+                   state['rgba'][dots], mask)
+
+    # scatter markers are clipped to the axes box
+    clip_left, clip_right, clip_top, clip_bottom = state['clip_box']
+    pixels = np.full((bottom - top, right - left, 3), 255, dtype=np.uint8)
+    inner_top, inner_bottom = max(clip_top, top) - top, min(clip_bottom, bottom) - top
+    inner_left, inner_right = max(clip_left, left) - left, min(clip_right, right) - left
+    if inner_top < inner_bottom and inner_left < inner_right:
+        pixels[inner_top:inner_bottom, inner_left:inner_right] = \
+            canvas[margin + inner_top:margin + inner_bottom, margin + inner_left:margin + inner_right]
+    image[top:bottom, left:right] = pixels
+    image.flush()
+    return len(dots)
+
+
+def render_poster(path, x, y, colors, marker_size, marker, figsize, dpi, equal_aspect=True, tile_size=TILE_SIZE,
+                  workers=1):
+    """
+    Rasterize a dot painting tile by tile into a TIFF or PNG file.
+
+    The result is the image `render_dots` would return for the same arguments, but only one tile per
+    worker is held in memory at a time.
+
+    Args:
+        path (str): The output file, a TIFF (".tif" or ".tiff") or a PNG (".png").
+        x (np.ndarray): The x coordinates of the dots.
+        y (np.ndarray): The y coordinates of the dots.
+        colors (array-like): One color per dot (RGBA rows or hex strings).
+        marker_size (float): The marker size in points ** 2.
+        marker (str): The matplotlib marker of every dot.
+        figsize (float): The width and height of the figure in inches.
+        dpi (int): The resolution of the image.
+        equal_aspect (bool): Whether the axes use an equal aspect ratio.
+        tile_size (int): The width and height of a tile in pixels.
+        workers (int): The number of worker processes rendering tiles in parallel.
+
+    Returns:
+        tuple: The width and height of the image in pixels.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    width, height, cols, rows, clip_box = image_layout(x, y, figsize, dpi, equal_aspect)
+    mask = marker_mask(marker, marker_size, dpi)
+    num_tile_cols = -(-width // tile_size)
+    num_tile_rows = -(-height // tile_size)
+    dots, starts = tile_index(cols, rows, mask.shape[0] // 2, tile_size, num_tile_cols, num_tile_rows)
+
+    is_png = path.lower().endswith('.png')
+    if is_png:
+        # tiles land in a scratch file next to the output, which is then encoded row by row
+        handle, image_path = tempfile.mkstemp(suffix='.raw', dir=os.path.dirname(os.path.abspath(path)))
+        os.close(handle)
+        offset = 0
+        with open(image_path, 'wb') as file:
+            file.truncate(width * height * 3)
+    else:
+        image_path = path
+        header = tiff_header(width, height, dpi)
+        offset = len(header)
+        with open(image_path, 'wb') as file:
+            file.write(header)
+            file.truncate(offset + width * height * 3)
+
+    state = {'path': image_path, 'offset': offset, 'width': width, 'height': height, 'tile_size': tile_size,
+             'num_tile_cols': num_tile_cols, 'mask': mask, 'clip_box': clip_box, 'cols': cols, 'rows': rows,
+             'rgba': to_rgba_array(colors), 'dots': dots, 'starts': starts}
+    tiles = range(num_tile_cols * num_tile_rows)
+    try:
+        if workers > 1:
+            with multiprocessing.Pool(workers, initializer=init_worker, initargs=(state,)) as pool:
+                for _ in pool.imap_unordered(render_tile, tiles):
+                    pass
+        else:
+            init_worker(state)
+            for tile in tiles:
+                render_tile(tile)
+
+        if is_png:
+            # read back with plain reads, a mapping would keep every page of the image resident
+            write_png(path, read_rows(image_path, width, height), width, height, dpi)
+    finally:
+        worker_state.clear()
+        if is_png:
+            os.remove(image_path)
+    return width, height
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Render a poster-size dot painting tile by tile.")
+    parser.add_argument("--palette", default="Pop Art", help="color style, see get_color_list")
+    parser.add_argument("--num-colors", type=int, default=10)
+    parser.add_argument("--canvas-shape", default="square",
+                        help="square, circle1, circle2, golden ratio, scatter, an IFS preset such as barnsley fern "
+                             "or sierpinski triangle (see ifs.IFS_PRESETS), or custom IFS with --ifs")
+    parser.add_argument("--shape", default="circle", help="dot shape")
+    parser.add_argument("--canvas-size", type=int, default=228)
+    parser.add_argument("--dot-size", type=float, default=800)
+    parser.add_argument("--gap-size", type=int, default=24)
+    parser.add_argument("--figsize-ratio", type=float, default=3.33)
+    parser.add_argument("--n", type=int, default=1000,
+                        help="number of points in the Barnsley fern or other IFS shape")
+    parser.add_argument("--ifs", help="JSON file defining the maps of the custom IFS canvas shape")
+    parser.add_argument("--cull", action="store_true", help="drop overlapping dots of the ring layouts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dpi", type=int, default=1200)
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes running the fern chaos game and rendering tiles")
+    parser.add_argument("--output", default="poster.tiff", help="TIFF or PNG file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    color_list = get_color_list(args.palette, args.num_colors)
+    if not len(color_list):
+        raise ValueError(f"Unknown palette: {args.palette}")
+    ifs_definition = None
+    if args.ifs:
+        with open(args.ifs) as file:
+            ifs_definition = file.read()
+    x, y, colors, marker_size, marker, figsize, equal_aspect = layout_painting(
+        color_list, args.dot_size, args.gap_size, args.canvas_size, args.canvas_shape, args.shape,
+        args.figsize_ratio, args.n, args.cull, args.seed, fern_workers=args.workers, ifs_definition=ifs_definition)
+    width, height = render_poster(args.output, x, y, colors, marker_size, marker, figsize, args.dpi, equal_aspect,
+                                  args.tile_size, args.workers)
+    print(f"wrote a {width}x{height} painting with {len(x):,} dots to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+from functools import lru_cache
+import numpy as np
+from matplotlib import rcParams
+from matplotlib.colors import to_rgba_array
+from matplotlib.markers import MarkerStyle
+from PIL import Image
+
+# number of samples per pixel along each axis when anti-aliasing a marker mask
+SUPERSAMPLING = 4
+
+# marker masks with more pixels than this are stamped dot by dot, smaller ones in vectorized batches
+LARGE_MASK_PIXELS = 256
+
+# number of (dot, pixel) pairs composited per vectorized batch
+BATCH_PAIRS = 2 ** 21
+
+# number of large-mask dots stamped between progress reports
+DOTS_PER_REPORT = 256
+
+# image formats that may be encoded from an 8-bit palette-indexed image, see `save_image`
+INDEXED_FORMATS = ("PNG", "WEBP")
+
+
+@lru_cache(maxsize=64)
+def marker_mask(marker, marker_size, dpi):
+    """
+    Pre-render a scatter marker as an anti-aliased alpha mask.
+
+    The mask matches what matplotlib's scatter draws for the same marker: the marker path scaled to
+    `marker_size` (points ** 2) plus an edge stroke of `lines.linewidth` points in the face color.
+
+    Args:
+        marker (str): The matplotlib marker (e.g. 'o', 's', '^', 'p', 'H', 'D').
+        marker_size (float): The marker size in points ** 2, as passed to `ax.scatter(s=...)`.
+        dpi (int): The resolution of the image the mask is stamped onto.
+
+    Returns:
+        np.ndarray: A square float32 mask with values in [0, 1], centered on its middle pixel.
+    """
+    marker_style = MarkerStyle(marker)
+    scale = np.sqrt(marker_size) * dpi / 72
+    path = marker_style.get_path().transformed(marker_style.get_transform().scale(scale))
+    half_stroke = rcParams['lines.linewidth'] * dpi / 72 / 2
+
+    half_size = int(np.ceil(np.abs(path.vertices).max() + half_stroke + 0.5))
+    size = 2 * half_size + 1
+
+    # sample points at the centers of the sub-pixels, y pointing up like the marker path
+    offsets = (np.arange(size * SUPERSAMPLING) + 0.5) / SUPERSAMPLING - half_size - 0.5
+    sample_x, sample_y = np.meshgrid(offsets, -offsets)
+    samples = np.column_stack([sample_x.ravel(), sample_y.ravel()])
+
+    # the sign of the radius that grows the path depends on its orientation, keep the larger one
+    inside = max((path.contains_points(samples, radius=radius) for radius in (half_stroke, -half_stroke)),
+                 key=np.count_nonzero)
+    coverage = inside.reshape(size, SUPERSAMPLING, size, SUPERSAMPLING).mean(axis=(1, 3))
+    return coverage.astype(np.float32)
+
+
+def axes_layout(x, y, figsize, dpi, equal_aspect=True):
+    """
+    Map data coordinates to pixel positions the way a default pyplot axes saved with
+    `bbox_inches='tight'` would.
+
+    Args:
+        x (np.ndarray): The x coordinates of the dots.
+        y (np.ndarray): The y coordinates of the dots.
+        figsize (float): The width and height of the figure in inches.
+        dpi (int): The resolution of the image.
+        equal_aspect (bool): Whether the axes use an equal aspect ratio.
+
+    Returns:
+        tuple: The column and row of every dot inside the axes box, and the box width and height, all in pixels.
+    """
+    margin = rcParams['axes.xmargin']
+    box_width = (rcParams['figure.subplot.right'] - rcParams['figure.subplot.left']) * figsize * dpi
+    box_height = (rcParams['figure.subplot.top'] - rcParams['figure.subplot.bottom']) * figsize * dpi
+
+    # an empty or single-valued axis still gets a unit range, like matplotlib's default limits
+    x_min, x_span = (x.min(), np.ptp(x) or 1.0) if len(x) else (0.0, 1.0)
+    y_min, y_span = (y.min(), np.ptp(y) or 1.0) if len(y) else (0.0, 1.0)
+    x_range = x_span * (1 + 2 * margin)
+    y_range = y_span * (1 + 2 * margin)
+
+    x_scale = box_width / x_range
+    y_scale = box_height / y_range
+    if equal_aspect:
+        # the axes box shrinks to keep the data aspect ratio
+        x_scale = y_scale = min(x_scale, y_scale)
+        box_width = x_scale * x_range
+        box_height = y_scale * y_range
+
+    cols = (x - x_min + margin * x_span) * x_scale
+    rows = box_height - (y - y_min + margin * y_span) * y_scale
+    return cols, rows, box_width, box_height
+
+
+def image_layout(x, y, figsize, dpi, equal_aspect=True):
+    """
+    Place every dot on the saved image the way `savefig(bbox_inches='tight')` would.
+
+    Args:
+        x (np.ndarray): The x coordinates of the dots.
+        y (np.ndarray): The y coordinates of the dots.
+        figsize (float): The width and height of the figure in inches.
+        dpi (int): The resolution of the image.
+        equal_aspect (bool): Whether the axes use an equal aspect ratio.
+
+    Returns:
+        tuple: The image width and height, the integer column and row of every dot center, and the
+            (left, right, top, bottom) pixel bounds of the axes box that clips the dots.
+    """
+    cols, rows, box_width, box_height = axes_layout(x, y, figsize, dpi, equal_aspect)
+
+    # the saved figure is the axes box padded like bbox_inches='tight', truncated to whole pixels;
+    # matplotlib measures from the bottom left corner, so the truncated fraction is lost at the top
+    pad = rcParams['savefig.pad_inches'] * dpi
+    image_width = int(box_width + 2 * pad)
+    image_height = int(box_height + 2 * pad)
+    top = image_height - pad - box_height
+    cols = np.floor(cols + pad).astype(np.intp)
+    rows = np.floor(rows + top).astype(np.intp)
+
+    clip_box = (int(round(pad)), int(round(pad + box_width)), int(round(top)), int(round(top + box_height)))
+    return image_width, image_height, cols, rows, clip_box
+
+
+def stamp_dots(image, cols, rows, rgba, mask, progress_callback=None):
+    """
+    Alpha-composite `mask` in the given colors at every dot position, in drawing order.
+
+    Args:
+        image (np.ndarray): The (H, W, 3) uint8 image to draw on, large enough to hold every mask.
+        cols (np.ndarray): The integer column of every dot center.
+        rows (np.ndarray): The integer row of every dot center.
+        rgba (np.ndarray): The (N, 4) float colors of the dots.
+        mask (np.ndarray): The alpha mask stamped at every dot.
+        progress_callback (callable, optional): Called with the fraction of dots stamped, between batches.
+    """
+    half_size = mask.shape[0] // 2
+    # float32 palettes lose too much precision in the cumulative sums below
+    rgba = np.asarray(rgba, dtype=np.float64)
+    colors = rgba[:, :3] * 255
+
+    if mask.size > LARGE_MASK_PIXELS:
+        # palettes are small, so premultiply the mask once per distinct color instead of once per dot
+        palette, color_index = np.unique(rgba, axis=0, return_inverse=True)
+        weights = (mask * palette[:, 3, np.newaxis, np.newaxis])[..., np.newaxis].astype(np.float32)
+        # spell out the channel axis, broadcasting a length-1 last axis is several times slower
+        keep = np.repeat(1 - weights, 3, axis=-1)
+        painted = weights * (palette[:, np.newaxis, np.newaxis, :3] * 255).astype(np.float32)
+        blended = np.empty(keep.shape[1:], dtype=np.float32)
+        for count, (col, row, index) in enumerate(zip(cols, rows, color_index.ravel())):
+            if progress_callback is not None and count % DOTS_PER_REPORT == 0:
+                progress_callback(count / len(cols))
+            region = image[row - half_size:row + half_size + 1, col - half_size:col + half_size + 1]
+            np.multiply(region, keep[index], out=blended)
+            blended += painted[index]
+            blended += 0.5
+            region[...] = blended
+        return
+
+    # Small masks: composite many (dot, pixel) pairs at once. Per pixel, sequential "over" compositing
+    # of dots with alphas a_k gives weight a_k * prod(1 - a_j for later j), computed with a reversed
+    # cumulative sum of logs within each pixel.
+    mask_rows, mask_cols = np.nonzero(mask)
+    mask_alpha = mask[mask_rows, mask_cols]
+    width = image.shape[1]
+    flat_image = image.reshape(-1, 3)
+    dots_per_batch = max(1, BATCH_PAIRS // len(mask_alpha))
+
+    for start in range(0, len(cols), dots_per_batch):
+        if progress_callback is not None:
+            progress_callback(start / len(cols))
+        batch = slice(start, start + dots_per_batch)
+        pixel = ((rows[batch, np.newaxis] + mask_rows - half_size) * width
+                 + cols[batch, np.newaxis] + mask_cols - half_size).ravel()
+        alpha = np.minimum((rgba[batch, 3, np.newaxis] * mask_alpha).ravel(), 1 - 1e-6)
+        dot = np.repeat(np.arange(len(cols))[batch], len(mask_alpha))
+
+        order = np.argsort(pixel, kind='stable')  # keeps the drawing order within a pixel
+        pixel, alpha, dot = pixel[order], alpha[order], dot[order]
+        first = np.flatnonzero(np.r_[True, pixel[1:] != pixel[:-1]])
+        count = np.diff(np.r_[first, len(pixel)])
+
+        log_keep = np.log1p(-alpha)
+        # sum of log(1 - a_j) over the later dots in the same pixel
+        later = np.repeat(np.add.reduceat(log_keep, first), count) - np.cumsum(log_keep) \
+            + np.repeat(np.cumsum(log_keep)[first] - log_keep[first], count)
+        weight = alpha * np.exp(later)
+
+        unique_pixel = pixel[first]
+        background = flat_image[unique_pixel] * np.exp(np.add.reduceat(log_keep, first))[:, np.newaxis]
+        painted = np.add.reduceat(colors[dot] * weight[:, np.newaxis], first)
+        flat_image[unique_pixel] = np.clip(np.rint(background + painted), 0, 255)
+
+
+def render_dots(x, y, colors, marker_size, marker, figsize, dpi, equal_aspect=True, progress_callback=None):
+    """
+    Rasterize a dot painting directly into a NumPy RGB buffer.
+
+    The result matches the matplotlib path (`ax.scatter` on an axis-less axes saved with
+    `bbox_inches='tight'`) without building a figure or any artists.
+
+    Args:
+        x (np.ndarray): The x coordinates of the dots.
+        y (np.ndarray): The y coordinates of the dots.
+        colors (array-like): One color per dot (hex strings or RGBA rows).
+        marker_size (float): The marker size in points ** 2.
+        marker (str): The matplotlib marker of every dot.
+        figsize (float): The width and height of the figure in inches.
+        dpi (int): The resolution of the image.
+        equal_aspect (bool): Whether the axes use an equal aspect ratio.
+        progress_callback (callable, optional): Called with the fraction of dots stamped.
+
+    Returns:
+        np.ndarray: The (H, W, 3) uint8 image on a white background.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    image_width, image_height, cols, rows, clip_box = image_layout(x, y, figsize, dpi, equal_aspect)
+    mask = marker_mask(marker, marker_size, dpi)
+    half_size = mask.shape[0] // 2
+
+    # draw onto the image grown by half a mask on every side so no stamp needs clipping
+    canvas = np.full((image_height + 2 * half_size, image_width + 2 * half_size, 3), 255, dtype=np.uint8)
+    if len(x):
+        stamp_dots(canvas, cols + half_size, rows + half_size, to_rgba_array(colors), mask, progress_callback)
+
+    # scatter markers are clipped to the axes box
+    left, right, top, bottom = clip_box
+    image = np.full((image_height, image_width, 3), 255, dtype=np.uint8)
+    image[top:bottom, left:right] = canvas[half_size + top:half_size + bottom, half_size + left:half_size + right]
+    return image
+
+
+def tone_map(counts, colors):
+    """
+    Turn a 2D histogram of hits into an image, mapping log density through a palette.
+
+    Empty pixels stay white; the lowest density maps to the first palette color and the highest
+    density to the last, with linear interpolation in between.
+
+    Args:
+        counts (np.ndarray): The (H, W) hit counts.
+        colors (np.ndarray): The (N, 4) RGBA palette, as returned by `get_color_list`.
+
+    Returns:
+        np.ndarray: The (H, W, 3) uint8 image.
+    """
+    palette = to_rgba_array(colors)[:, :3] * 255
+    hit = counts > 0
+    level = np.log1p(counts[hit]) / np.log1p(counts.max()) if hit.any() else np.empty(0)
+
+    position = level * (len(palette) - 1)
+    lower = np.floor(position).astype(np.intp)
+    upper = np.minimum(lower + 1, len(palette) - 1)
+    fraction = (position - lower)[:, np.newaxis]
+
+    image = np.full(counts.shape + (3,), 255, dtype=np.uint8)
+    image[hit] = np.rint(palette[lower] * (1 - fraction) + palette[upper] * fraction)
+    return image
+
+
+def blend_palette(colors, levels=SUPERSAMPLING ** 2):
+    """
+    Build an indexed-image palette holding white and every color blended with white at a few opacities.
+
+    Anti-aliased dots that do not overlap on white only take these colors, one per coverage level of a
+    marker mask at the default `levels`; overlapping dots mix colors the palette only approximates.
+    Levels are reduced when the palette would not fit in 256 entries.
+
+    Args:
+        colors (array-like): The palette colors (RGBA rows or hex strings).
+        levels (int): The number of opacities per color, the last one opaque.
+
+    Returns:
+        np.ndarray: The (M, 3) uint8 palette, white first, M <= 256.
+    """
+    rgb = to_rgba_array(colors)[:, :3] * 255
+    levels = max(1, min(levels, 255 // max(len(rgb), 1)))
+    alpha = (np.arange(levels) + 1)[:, np.newaxis, np.newaxis] / levels
+    blends = (255 * (1 - alpha) + rgb * alpha).reshape(-1, 3)[:255]
+    return np.vstack([[255, 255, 255], blends]).round().astype(np.uint8)
+
+
+def gradient_palette(colors, size=255):
+    """
+    Build an indexed-image palette holding white and `size` steps along the `tone_map` gradient.
+
+    Args:
+        colors (array-like): The palette colors (RGBA rows or hex strings), lowest density first.
+        size (int): The number of gradient steps, at most 255.
+
+    Returns:
+        np.ndarray: The (size + 1, 3) uint8 palette, white first.
+    """
+    palette = to_rgba_array(colors)[:, :3] * 255
+    position = np.linspace(0, len(palette) - 1, size)
+    lower = np.floor(position).astype(np.intp)
+    upper = np.minimum(lower + 1, len(palette) - 1)
+    fraction = (position - lower)[:, np.newaxis]
+    return np.vstack([[255, 255, 255], np.rint(palette[lower] * (1 - fraction) + palette[upper] * fraction)]) \
+        .astype(np.uint8)
+
+
+def palette_image(entries):
+    """
+    Wrap palette entries in the "P" image Pillow quantizes to.
+
+    Args:
+        entries (np.ndarray): The (M, 3) uint8 palette, M <= 256.
+
+    Returns:
+        PIL.Image.Image: A "P" image carrying the palette, for `Image.quantize(palette=...)`; unused
+            slots repeat the first entry.
+    """
+    palette = Image.new("P", (1, 1))
+    palette.putpalette(entries.ravel().tolist() + entries[0].tolist() * (256 - len(entries)))
+    return palette
+
+
+def index_image(image):
+    """
+    Index an RGB image on its own colors, if it has few enough for an 8-bit palette.
+
+    The distinct colors are found through a table over all 2 ** 24 colors, which also maps every pixel
+    to its palette entry, so the indexed image is exactly the RGB one.
+
+    Args:
+        image (np.ndarray): The (H, W, 3) uint8 image.
+
+    Returns:
+        tuple: The (H, W) uint8 palette indices and the (M, 3) uint8 palette, or None if the image holds
+            more than 256 colors.
+    """
+    # packed in place, large images hold one int32 per pixel at a time
+    packed = image[..., 0].astype(np.int32)
+    packed <<= 8
+    packed |= image[..., 1]
+    packed <<= 8
+    packed |= image[..., 2]
+    seen = np.zeros(2 ** 24, dtype=bool)
+    seen[packed] = True
+    distinct = np.flatnonzero(seen)
+    if len(distinct) > 256:
+        return None
+    lookup = np.zeros(2 ** 24, dtype=np.uint8)
+    lookup[distinct] = np.arange(len(distinct))
+    palette = np.stack([distinct >> 16, (distinct >> 8) & 255, distinct & 255], axis=1).astype(np.uint8)
+    return lookup[packed], palette
+
+
+def save_image(image, buffer, image_format, dpi, palette=None, compress_level=6):
+    """
+    Encode an RGB buffer into `buffer`.
+
+    PNG is written 8-bit palette-indexed: exactly on the image's own colors when it has at most 256, e.g.
+    dots that do not overlap on white, and otherwise mapped onto `palette` by Pillow's nearest-color
+    quantizer, which only approximates overlapping dots and Matplotlib's anti-aliasing. WebP is lossless,
+    indexed when the image has at most 256 colors and RGB otherwise.
+
+    Args:
+        image (np.ndarray): The (H, W, 3) uint8 image.
+        buffer (file-like): The binary stream to write to.
+        image_format (str): The Pillow format name, "JPEG", "PNG" or "WEBP".
+        dpi (int): The resolution stored in the image metadata.
+        palette (np.ndarray, optional): The (M, 3) uint8 palette of a PNG with more than 256 colors, see
+            `blend_palette` and `gradient_palette`. Without it, such a PNG is written as RGB.
+        compress_level (int): The PNG and WebP compression effort, from 0 (fastest) to 9 (smallest).
+    """
+    if image_format not in INDEXED_FORMATS:
+        Image.fromarray(image).save(buffer, format=image_format, dpi=(dpi, dpi))
+        return
+
+    indexed = index_image(image)
+    if indexed is not None:
+        output = Image.fromarray(indexed[0], mode="P")
+        output.putpalette(indexed[1].ravel().tolist())
+    elif image_format == "PNG" and palette is not None:
+        output = Image.fromarray(image).quantize(palette=palette_image(palette), dither=Image.Dither.NONE)
+    else:
+        output = Image.fromarray(image)
+    if image_format == "PNG":
+        output.save(buffer, format="PNG", dpi=(dpi, dpi), compress_level=compress_level)
+    else:
+        # for lossless WebP, quality is the compression effort; methods above 4 take several times longer
+        # for a percent or so
+        output.save(buffer, format="WEBP", lossless=True, quality=compress_level * 100 // 9,
+                    method=min(4, compress_level * 6 // 9), dpi=(dpi, dpi))
@@ -0,0 +1,348 @@
+"""
+Render dot paintings to disk without Streamlit.
+
+Every combination of the given palettes, canvas shapes, dot shapes, canvas sizes and seeds is rendered
+in parallel across a pool of worker processes, for example:
+
+    python render_cli.py --palettes "Pop Art" Viridis --canvas-shapes square "golden ratio" \
+        --sizes 228 400 --seeds 0 1 2 --format JPEG --output gallery
+
+Jobs can also be read from a JSON file (a list of objects) or a CSV file (one job per row), whose
+keys are the parameters of `render_painting` plus `palette`, `num_colors` and an optional output file
+`name`. Missing keys fall back to the command line values.
+"""
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+import matplotlib
+
+matplotlib.use("Agg")  # headless, no GUI backend in the workers
+
+from color_options import get_color_list  # noqa: E402
+from painting import FILE_EXTENSIONS, output_format, render_painting  # noqa: E402
+
+
+def parse_flag(value):
+    """
+    Parse a yes/no CSV cell such as "true", "1" or "no".
+
+    Args:
+        value (str): The cell.
+
+    Returns:
+        bool: Whether the cell means yes.
+
+    Raises:
+        ValueError: If the cell means neither yes nor no.
+    """
+    flag = value.strip().lower()
+    if flag not in ("1", "true", "yes", "0", "false", "no"):
+        raise ValueError(f"not a yes/no value: {value!r}")
+    return flag in ("1", "true", "yes")
+
+
+# parameters of a job and the type used to parse them, see `parse_value`
+JOB_PARAMETERS = {
+    "name": str,
+    "palette": str,
+    "num_colors": int,
+    "dot_size": float,
+    "gap_size": int,
+    "canvas_size": int,
+    "canvas_shape": str,
+    "shape": str,
+    "dpi": int,
+    "figsize_ratio": float,
+    "image_format": str,
+    "renderer": str,
+    "fern_mode": str,
+    "n": int,
+    "seed": int,
+    "cull": parse_flag,
+    "ifs_definition": str,
+    "compress_level": int,
+}
+
+
+def parse_value(key, value):
+    """
+    Parse one job parameter from a CSV cell, a query string or a JSON value.
+
+    Args:
+        key (str): The parameter name, a key of `JOB_PARAMETERS`.
+        value: The value, text or any JSON value.
+
+    Returns:
+        The value converted to the type of the parameter.
+
+    Raises:
+        TypeError: If a JSON value has no meaning for the parameter, e.g. a list for a number.
+        ValueError: If a text value does not parse as the type of the parameter.
+    """
+    parse = JOB_PARAMETERS[key]
+    if parse is parse_flag and not isinstance(value, str):
+        return bool(value)
+    if parse is str and isinstance(value, (dict, list)):
+        # e.g. an IFS definition given as a JSON object rather than as its text
+        return json.dumps(value)
+    return parse(value)
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Render dot paintings to disk in parallel.")
+    parser.add_argument("--palettes", nargs="+", default=["Pop Art"], help="color styles, see get_color_list")
+    parser.add_argument("--canvas-shapes", nargs="+", default=["square"],
+                        help="square, circle1, circle2, golden ratio, scatter, an IFS preset such as barnsley fern "
+                             "or sierpinski triangle (see ifs.IFS_PRESETS), or custom IFS with --ifs")
+    parser.add_argument("--shapes", nargs="+", default=["circle"],
+                        help="dot shapes: circle, square, triangle, pentagon, hexagon or diamond")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[228], help="canvas sizes")
+    parser.add_argument("--seeds", nargs="+", type=int, default=[0], help="random seeds")
+    parser.add_argument("--jobs", help="JSON or CSV job file, replaces the parameter grid")
+    parser.add_argument("--num-colors", type=int, default=10)
+    parser.add_argument("--dot-size", type=float, default=800)
+    parser.add_argument("--gap-size", type=int, default=24)
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--figsize-ratio", type=float, default=3.33)
+    parser.add_argument("--format", dest="image_format", choices=sorted(FILE_EXTENSIONS), default="SVG",
+                        help="PNG is 8-bit palette-indexed (approximate where dots overlap), WEBP is lossless")
+    parser.add_argument("--compress-level", type=int, choices=range(10), default=6,
+                        help="PNG and WebP compression effort, 0 (fastest) to 9 (smallest)")
+    parser.add_argument("--renderer", choices=["Direct", "Matplotlib"], default="Direct")
+    parser.add_argument("--fern-mode", choices=["Points", "Density"], default="Points")
+    parser.add_argument("--n", type=int, default=1000,
+                        help="number of points in the Barnsley fern or other IFS shape")
+    parser.add_argument("--ifs", help="JSON file defining the maps of the custom IFS canvas shape")
+    parser.add_argument("--cull", action="store_true", help="drop overlapping dots of the ring layouts")
+    parser.add_argument("--output", default="renders", help="output directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--log-metrics", action="store_true",
+                        help="log the stage timings and counters of every render as JSON lines")
+    return parser
+
+
+def parse_args(argv=None):
+    return make_parser().parse_args(argv)
+
+
+def default_job(args):
+    """
+    Build the job parameters shared by every job from the command line.
+
+    Args:
+        args (argparse.Namespace): The parsed command line.
+
+    Returns:
+        dict: The job parameters, without the ones the grid varies.
+    """
+    job = {"num_colors": args.num_colors, "dot_size": args.dot_size, "gap_size": args.gap_size, "dpi": args.dpi,
+           "figsize_ratio": args.figsize_ratio, "image_format": args.image_format, "renderer": args.renderer,
+           "fern_mode": args.fern_mode, "n": args.n, "cull": args.cull, "compress_level": args.compress_level}
+    if args.ifs:
+        with open(args.ifs) as file:
+            job["ifs_definition"] = file.read()
+    return job
+
+
+def first_job(args):
+    """
+    Build a complete job from the command line, taking the first value of every parameter the grid varies.
+
+    Args:
+        args (argparse.Namespace): The parsed command line.
+
+    Returns:
+        dict: The job parameters.
+    """
+    return dict(default_job(args), palette=args.palettes[0], canvas_shape=args.canvas_shapes[0],
+                shape=args.shapes[0], canvas_size=args.sizes[0], seed=args.seeds[0])
+
+
+def grid_jobs(args):
+    """
+    Build one job for every combination of palette, canvas shape, dot shape, canvas size and seed.
+
+    Args:
+        args (argparse.Namespace): The parsed command line.
+
+    Returns:
+        list: The job parameter dicts.
+    """
+    grid = itertools.product(args.palettes, args.canvas_shapes, args.shapes, args.sizes, args.seeds)
+    return [dict(default_job(args), palette=palette, canvas_shape=canvas_shape, shape=shape, canvas_size=size,
+                 seed=seed)
+            for palette, canvas_shape, shape, size, seed in grid]
+
+
+def read_jobs(path, args):
+    """
+    Read jobs from a JSON or CSV file, filling in missing parameters from the command line.
+
+    Args:
+        path (str): The job file, a JSON list of objects or a CSV file with a header row.
+        args (argparse.Namespace): The parsed command line.
+
+    Returns:
+        list: The job parameter dicts.
+
+    Raises:
+        ValueError: If the file is not a list of jobs, or a job has an unknown parameter or a value that
+            does not parse, see `parse_value`.
+    """
+    defaults = first_job(args)
+    with open(path, newline="") as file:
+        if path.lower().endswith(".json"):
+            rows = json.load(file)
+            if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+                raise ValueError(f"{path} must hold a list of job objects")
+        else:
+            rows = [{key: value for key, value in row.items() if value != ""} for row in csv.DictReader(file)]
+
+    jobs = []
+    for number, row in enumerate(rows, 1):
+        # cells beyond the header row have no column name
+        unknown = {str(key) for key in set(row) - set(JOB_PARAMETERS)}
+        if unknown:
+            raise ValueError(f"Unknown job parameters in {path}: {', '.join(sorted(unknown))}")
+        try:
+            jobs.append(dict(defaults, **{key: parse_value(key, value) for key, value in row.items()}))
+        except (TypeError, ValueError) as error:
+            raise ValueError(f"Invalid value in job {number} of {path}: {error}")
+    return jobs
+
+
+# parameters always in the output file name, in this order
+NAME_PARAMETERS = ("palette", "canvas_shape", "shape", "canvas_size")
+
+
+def job_file_name(job, defaults):
+    """
+    Name the output file after the parameters that usually vary between jobs, unless the job is named.
+
+    Every other parameter that differs from the defaults is appended as well, so jobs that only differ
+    in e.g. their DPI or gap size do not overwrite each other.
+
+    Args:
+        job (dict): The job parameters.
+        defaults (dict): The parameters shared by every job, see `first_job`.
+
+    Returns:
+        str: The file name, e.g. "pop-art_golden-ratio_circle_228_seed0.svg" or
+            "pop-art_square_circle_228_seed0_dpi-100_gap-size-10.jpeg".
+    """
+    extension = FILE_EXTENSIONS[job['image_format']]
+    if "name" in job:
+        return f"{job['name']}.{extension}"
+    parts = [str(job[key]) for key in NAME_PARAMETERS] + [f"seed{job['seed']}"]
+    for key in JOB_PARAMETERS:
+        if key in NAME_PARAMETERS + ("name", "seed", "image_format") or job.get(key) == defaults.get(key):
+            continue
+        value = job.get(key)
+        if key == "ifs_definition" and value is not None:
+            # the definition itself is too long for a file name
+            value = hashlib.blake2b(value.encode(), digest_size=4).hexdigest()
+        key = key.replace("_", "-")
+        parts.append(key if value is True else f"{key}-{value:g}" if isinstance(value, float) else f"{key}-{value}")
+    name = re.sub(r"[^a-z0-9_.]+", "-", "_".join(parts).lower())
+    return f"{name}.{extension}"
+
+
+def output_paths(jobs, defaults, output):
+    """
+    Find the output path of every job, making sure no two jobs write the same file.
+
+    Args:
+        jobs (list): The job parameter dicts.
+        defaults (dict): The parameters shared by every job, see `first_job`.
+        output (str): The output directory.
+
+    Returns:
+        list: The output path of every job.
+    """
+    paths = [os.path.join(output, job_file_name(job, defaults)) for job in jobs]
+    duplicates = sorted({path for path in paths if paths.count(path) > 1})
+    if duplicates:
+        raise ValueError(f"Several jobs would write {', '.join(duplicates)}; name them or make them differ")
+    return paths
+
+
+def render_job(job, path):
+    """
+    Render one job to disk, run inside a worker process.
+
+    A failing job is reported instead of raised, so it does not abort the rest of the batch.
+
+    Args:
+        job (dict): The job parameters.
+        path (str): The output file.
+
+    Returns:
+        tuple: The output path, the render time in seconds, and the size of the file in bytes or the
+            error message of a failed job.
+    """
+    start = time.perf_counter()
+    parameters = dict(job)
+    parameters.pop("name", None)
+    try:
+        color_list = get_color_list(parameters.pop("palette"), parameters.pop("num_colors"))
+        if not len(color_list):
+            raise ValueError(f"Unknown palette: {job['palette']}")
+        painting = render_painting(color_list, **parameters)
+
+        with open(path, "wb") as file:
+            file.write(painting)
+    except Exception as error:
+        return path, time.perf_counter() - start, f"{type(error).__name__}: {error}"
+    return path, time.perf_counter() - start, len(painting)
+
+
+def render_task(task):
+    return render_job(*task)
+
+
+def main(argv=None):
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    if args.log_metrics:
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+    try:
+        jobs = read_jobs(args.jobs, args) if args.jobs else grid_jobs(args)
+        for job in jobs:
+            # name the file after what is written into it
+            job["image_format"] = output_format(job["canvas_shape"], job["fern_mode"], job["image_format"])
+        paths = output_paths(jobs, first_job(args), args.output)
+    except (OSError, ValueError) as error:
+        # a bad job file or --ifs file, reported like any other bad argument
+        parser.error(str(error))
+    os.makedirs(args.output, exist_ok=True)
+
+    start = time.perf_counter()
+    failed = 0
+    with multiprocessing.Pool(args.workers) as pool:
+        # report every job as soon as it finishes, whatever the submission order
+        for path, seconds, size in pool.imap_unordered(render_task, zip(jobs, paths)):
+            if isinstance(size, str):
+                failed += 1
+                print(f"{seconds:8.3f}s {'FAILED':>18}  {path}: {size}", flush=True)
+            else:
+                print(f"{seconds:8.3f}s {size:>12,} bytes  {path}", flush=True)
+    elapsed = time.perf_counter() - start
+    print(f"rendered {len(jobs) - failed} paintings in {elapsed:.2f}s with {args.workers} workers "
+          f"({(len(jobs) - failed) / elapsed:.1f} paintings/s)")
+    if failed:
+        print(f"{failed} of {len(jobs)} jobs failed")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
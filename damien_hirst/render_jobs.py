@@ -0,0 +1,108 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# renders running at once, shared by every session of the server
+MAX_CONCURRENT_RENDERS = os.cpu_count() or 1
+
+# seconds between checks for cancellation while a job waits for a render slot
+SLOT_POLL_SECONDS = 0.1
+
+render_slots = threading.BoundedSemaphore(MAX_CONCURRENT_RENDERS)
+
+# threads beyond the render slots only wait out their delay or for a slot; jobs past them queue up
+executor = ThreadPoolExecutor(max_workers=4 * MAX_CONCURRENT_RENDERS, thread_name_prefix="render")
+
+
+class RenderCancelled(Exception):
+    """Raised inside a render job once it has been cancelled."""
+
+
+class RenderJob:
+    """
+    A render running on a worker thread that can be cancelled and reports its progress.
+
+    Cancellation is cooperative: the job stops while it waits to start, and between batches of work
+    whenever the render reports progress (the Barnsley fern does so a fixed number of times).
+
+    Attributes:
+        key (hashable): What the job renders, to tell whether a newer request supersedes it.
+        progress (float): The completed fraction last reported by the render.
+    """
+
+    def __init__(self, function, key=None, delay=0.0):
+        """
+        Start a render job.
+
+        Args:
+            function (callable): The render, called with a progress callback that raises
+                `RenderCancelled` once the job is cancelled.
+            key (hashable, optional): What the job renders.
+            delay (float): The seconds to wait before taking a render slot, so that a job superseded
+                within them (e.g. by the next value of a dragged slider) costs nothing.
+        """
+        self.key = key
+        self.progress = 0.0
+        self.cancelled = threading.Event()
+        self.future = executor.submit(self.run, function, delay)
+
+    def run(self, function, delay):
+        if self.cancelled.wait(delay):
+            raise RenderCancelled()
+        while not render_slots.acquire(timeout=SLOT_POLL_SECONDS):
+            self.check()
+        try:
+            self.check()
+            return function(self.report)
+        finally:
+            render_slots.release()
+
+    def report(self, fraction):
+        """
+        Record the completed fraction, stopping the render if the job was cancelled.
+
+        Args:
+            fraction (float): The completed fraction (0 to 1).
+        """
+        self.check()
+        self.progress = fraction
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise RenderCancelled()
+
+    def cancel(self):
+        """Stop the job at its next check; a job still queued never starts."""
+        self.cancelled.set()
+        self.future.cancel()
+
+    def failed(self):
+        """
+        Tell whether the job has finished by raising, including by being cancelled.
+
+        Returns:
+            bool: Whether the job raised.
+        """
+        return self.future.done() and (self.future.cancelled() or self.future.exception() is not None)
+
+    def wait(self, timeout=None):
+        """
+        Wait for the job to finish.
+
+        Args:
+            timeout (float, optional): The maximum number of seconds to wait.
+
+        Returns:
+            bool: Whether the job has finished.
+        """
+        wait([self.future], timeout)
+        return self.future.done()
+
+    def result(self):
+        """
+        Get the value returned by the render, raising what the render raised.
+
+        Returns:
+            The value returned by the render.
+        """
+        return self.future.result()
@@ -0,0 +1,404 @@
+"""
+Serve dot paintings over HTTP.
+
+A plain ASGI app renders a painting for every request to `/render`, taking the job parameters of
+`render_cli.py` (the parameters of `render_painting` plus `palette` and `num_colors`) from the query
+string of a GET or the JSON object body of a POST. Missing parameters fall back to the render_cli
+defaults, so for example
+
+    python render_service.py --port 8000 --workers 4
+    curl "http://127.0.0.1:8000/render?palette=Viridis&canvas_shape=golden+ratio&image_format=PNG" -o painting.png
+
+Renders run on a pool of worker processes, so the event loop keeps serving other clients meanwhile.
+Requests for a painting that is already being rendered wait for that render instead of starting
+another, and finished paintings are kept in a cache bounded by their total size. Every response
+carries an ETag, and a request whose If-None-Match matches it gets an empty 304 response.
+"""
+import argparse
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qsl
+
+import uvicorn
+
+from color_options import get_color_list
+from ifs import CUSTOM_IFS, IFS_SHAPES
+from painting import CANVAS_LAYOUTS, DOT_MARKERS, FILE_EXTENSIONS, output_format, render_painting
+from raster_backend import INDEXED_FORMATS
+from render_cli import JOB_PARAMETERS, first_job, parse_args as parse_cli_args, parse_value
+
+logger = logging.getLogger(__name__)
+
+# MIME type of every image format; SVGZ is an SVG sent gzip-encoded
+MEDIA_TYPES = {"SVG": "image/svg+xml", "SVGZ": "image/svg+xml", "JPEG": "image/jpeg", "PNG": "image/png",
+               "WEBP": "image/webp"}
+
+# request bodies only carry the job parameters, including at most an IFS definition
+MAX_BODY_BYTES = 2 ** 20
+
+DEFAULT_CACHE_BYTES = 256 * 2 ** 20
+
+# the range of every numeric parameter, the limits of the app's inputs
+PARAMETER_RANGES = {
+    "num_colors": (1, 25),
+    "dot_size": (5, 800),
+    "gap_size": (10, 50),
+    "canvas_size": (70, 800),
+    "figsize_ratio": (0.1, 10.0),
+    "dpi": (100, 300),
+    "n": (100, 100000),
+    "seed": (0, 2 ** 32 - 1),
+    "compress_level": (0, 9),
+}
+
+# the allowed values of every text parameter with a fixed set of choices
+PARAMETER_CHOICES = {
+    "canvas_shape": CANVAS_LAYOUTS + IFS_SHAPES,
+    "shape": list(DOT_MARKERS),
+    "renderer": ["Direct", "Matplotlib"],
+    "fern_mode": ["Points", "Density"],
+    "image_format": list(FILE_EXTENSIONS),
+}
+
+# the density fern keeps counts per pixel instead of points, so the app allows print-size numbers of points
+DENSITY_MAX_POINTS = 10 ** 9
+
+
+class BadRequest(Exception):
+    """Raised for a request that does not describe a painting."""
+
+
+class BodyTooLarge(BadRequest):
+    """Raised for a request body beyond `MAX_BODY_BYTES`."""
+
+
+def normalize_job(parameters, defaults):
+    """
+    Validate the job parameters of a request and fill in the missing ones.
+
+    Parameters that do not change the painting are reset to their defaults (or dropped, for the IFS
+    definition of the built-in shapes), so that requests for the same painting share a cache entry and
+    an in-flight render.
+
+    Args:
+        parameters (dict): The parameters given by the request.
+        defaults (dict): The parameters of a complete job, see `render_cli.first_job`.
+
+    Returns:
+        dict: The job parameters.
+    """
+    # the output file name of render_cli has no meaning here
+    unknown = set(parameters) - (set(JOB_PARAMETERS) - {"name"})
+    if unknown:
+        raise BadRequest(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    try:
+        job = dict(defaults, **{key: parse_value(key, value) for key, value in parameters.items()})
+    except (TypeError, ValueError) as error:
+        raise BadRequest(f"Invalid parameter value: {error}")
+
+    for key, (low, high) in PARAMETER_RANGES.items():
+        if key == "n" and job["fern_mode"] == "Density":
+            high = DENSITY_MAX_POINTS
+        if not low <= job[key] <= high:
+            raise BadRequest(f"{key} must lie between {low} and {high}")
+    for key, choices in PARAMETER_CHOICES.items():
+        if job[key] not in choices:
+            raise BadRequest(f"Unknown {key}: {job[key]}, use one of {', '.join(choices)}")
+    if not len(get_color_list(job["palette"], job["num_colors"])):
+        raise BadRequest(f"Unknown palette: {job['palette']}")
+    # the density fern is a raster image, rendered as a JPEG like in the app
+    job["image_format"] = output_format(job["canvas_shape"], job["fern_mode"], job["image_format"])
+    ignored = set()
+    if job["canvas_shape"] not in IFS_SHAPES:
+        ignored |= {"n", "fern_mode"}
+    elif job["fern_mode"] == "Density":
+        # the density image is drawn straight from the hit counts, there are no dots
+        ignored |= {"dot_size", "gap_size", "canvas_size", "shape", "figsize_ratio", "renderer"}
+    if job["canvas_shape"] not in ("circle1", "circle2"):
+        ignored.add("cull")
+    if job["image_format"] in ("SVG", "SVGZ"):
+        ignored.add("dpi")
+    if job["image_format"] not in INDEXED_FORMATS:
+        ignored.add("compress_level")
+    job.update({key: defaults[key] for key in ignored})
+    if job["canvas_shape"] != CUSTOM_IFS:
+        job.pop("ifs_definition", None)
+    return job
+
+
+def render_request(job):
+    """
+    Render one job, run inside a worker process.
+
+    Args:
+        job (dict): The job parameters, see `normalize_job`.
+
+    Returns:
+        tuple: The encoded painting and its ETag.
+    """
+    parameters = dict(job)
+    color_list = get_color_list(parameters.pop("palette"), parameters.pop("num_colors"))
+    painting = render_painting(color_list, **parameters)
+    return painting, f'"{hashlib.blake2b(painting, digest_size=16).hexdigest()}"'
+
+
+class RenderCache:
+    """
+    The most recently used paintings, bounded by their total size.
+
+    Attributes:
+        max_bytes (int): The total size of the paintings kept.
+        size (int): The total size of the paintings now in the cache.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        """
+        Look up a painting, marking it as the most recently used.
+
+        Args:
+            key (str): The job key.
+
+        Returns:
+            tuple: The painting and its ETag, or None if it is not cached.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, painting, etag):
+        """
+        Add a painting, dropping the least recently used ones beyond the size bound.
+
+        Args:
+            key (str): The job key.
+            painting (bytes): The encoded painting.
+            etag (str): The ETag of the painting.
+        """
+        if len(painting) > self.max_bytes or key in self.entries:
+            return
+        self.entries[key] = (painting, etag)
+        self.size += len(painting)
+        while self.size > self.max_bytes:
+            _, (dropped, _) = self.entries.popitem(last=False)
+            self.size -= len(dropped)
+
+
+class RenderService:
+    """
+    The ASGI app serving dot paintings, see the module docstring.
+
+    Attributes:
+        defaults (dict): The parameters of requests that leave them out.
+        cache (RenderCache): The finished paintings.
+        in_flight (dict): The future of every render still running, by job key.
+    """
+
+    def __init__(self, workers=None, cache_bytes=DEFAULT_CACHE_BYTES, defaults=None):
+        """
+        Set up the service; the worker processes start with the first render.
+
+        Args:
+            workers (int, optional): The number of worker processes, by default one per CPU.
+            cache_bytes (int): The total size of the paintings kept in the cache.
+            defaults (dict, optional): The parameters of requests that leave them out, by default
+                those of `render_cli.py`.
+        """
+        self.defaults = defaults or first_job(parse_cli_args([]))
+        self.cache = RenderCache(cache_bytes)
+        self.in_flight = {}
+        self.executor = ProcessPoolExecutor(workers or os.cpu_count())
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.handle(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def handle(self, scope, receive, send):
+        if scope["path"] != "/render":
+            await respond(send, 404, b"Not found")
+            return
+        if scope["method"] not in ("GET", "POST"):
+            await respond(send, 405, b"Use GET or POST", [(b"allow", b"GET, POST")])
+            return
+
+        try:
+            parameters = dict(parse_qsl(scope["query_string"].decode()))
+            if scope["method"] == "POST":
+                parameters.update(await read_json(receive))
+            job = normalize_job(parameters, self.defaults)
+            (painting, etag), status = await self.render(job)
+        except BadRequest as error:
+            await respond(send, 413 if isinstance(error, BodyTooLarge) else 400, str(error).encode())
+            return
+        except ValueError as error:
+            # e.g. an invalid IFS definition, raised by the render
+            await respond(send, 400, str(error).encode())
+            return
+        except Exception:
+            logger.exception("render failed")
+            await respond(send, 500, b"Render failed")
+            return
+
+        headers = [(b"etag", etag.encode()), (b"x-render-cache", status.encode())]
+        if etag_matches(request_header(scope, b"if-none-match"), etag):
+            await respond(send, 304, b"", headers)
+            return
+        headers.append((b"content-type", MEDIA_TYPES[job["image_format"]].encode()))
+        if job["image_format"] == "SVGZ":
+            headers.append((b"content-encoding", b"gzip"))
+        await respond(send, 200, painting, headers)
+
+    async def render(self, job):
+        """
+        Get a painting from the cache, from a render already running for it, or from a new render.
+
+        Args:
+            job (dict): The job parameters, see `normalize_job`.
+
+        Returns:
+            tuple: The painting and its ETag, and how the request was served: "hit", "coalesced" or "miss".
+        """
+        key = json.dumps(job, sort_keys=True)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached, "hit"
+
+        future = self.in_flight.get(key)
+        status = "coalesced"
+        if future is None:
+            status = "miss"
+            future = asyncio.get_running_loop().run_in_executor(self.executor, render_request, job)
+            self.in_flight[key] = future
+            future.add_done_callback(functools.partial(self.finish, key))
+        # a client that goes away does not cancel the render the other clients wait for
+        return await asyncio.shield(future), status
+
+    def finish(self, key, future):
+        del self.in_flight[key]
+        # failed renders are not cached, the next request tries again
+        if not future.cancelled() and future.exception() is None:
+            self.cache.put(key, *future.result())
+
+
+async def read_json(receive):
+    """
+    Read the JSON object body of a request.
+
+    Args:
+        receive (callable): The ASGI receive channel.
+
+    Returns:
+        dict: The job parameters in the body, empty for an empty body.
+    """
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if len(body) > MAX_BODY_BYTES:
+            raise BodyTooLarge(f"Request body above {MAX_BODY_BYTES} bytes")
+    if not body.strip():
+        return {}
+    try:
+        parameters = json.loads(body)
+    except ValueError as error:
+        raise BadRequest(f"Invalid JSON body: {error}")
+    if not isinstance(parameters, dict):
+        raise BadRequest("The JSON body must be an object of job parameters")
+    return parameters
+
+
+def request_header(scope, name):
+    """
+    Get a request header.
+
+    Args:
+        scope (dict): The ASGI connection scope.
+        name (bytes): The lowercase header name.
+
+    Returns:
+        str: The header value, or None if the request does not carry it.
+    """
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Check an If-None-Match header against the ETag of a painting, with the weak comparison it calls for.
+
+    Args:
+        if_none_match (str): The header value, or None.
+        etag (str): The ETag of the painting.
+
+    Returns:
+        bool: Whether the client already holds the painting.
+    """
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+async def respond(send, status, body, headers=()):
+    """
+    Send a complete response.
+
+    Args:
+        send (callable): The ASGI send channel.
+        status (int): The HTTP status code.
+        body (bytes): The response body, plain text for errors.
+        headers (iterable): Extra (name, value) header pairs, as lowercase bytes.
+    """
+    headers = list(headers)
+    if status >= 400:
+        headers.append((b"content-type", b"text/plain; charset=utf-8"))
+    headers.append((b"content-length", str(len(body)).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve dot paintings over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_BYTES // 2 ** 20,
+                        help="total size of the cached paintings in MiB")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    uvicorn.run(RenderService(args.workers, args.cache_size * 2 ** 20), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,14 @@
 import streamlit as st
-import numpy as np
-import random
-import matplotlib.pyplot as plt
 import matplotlib.cm as cm
-from io import BytesIO
+import gzip
+import json
 from my_fonts import font_style, my_text_header, my_text_paragraph
-from barnsley_fern import BarnsleyFern
+from animation import ANIMATION_FORMATS, available_formats
 from color_options import get_color_list
+from ifs import CUSTOM_IFS, IFS_PRESETS, IFS_SHAPES, parse_ifs
+from metrics import RenderMetrics, publish
+from painting import CANVAS_LAYOUTS, DOT_MARKERS, FILE_EXTENSIONS, output_format, render_animation, render_painting
+from render_jobs import RenderJob
 
 st.set_page_config(
     page_title="Dotty",
@@ -16,6 +18,87 @@ st.set_page_config(
 )
 
 
+# number of encoded paintings kept in the render cache, shared by all sessions
+RENDER_CACHE_SIZE = 64
+
+# animations are cached separately, they are larger and rarely requested
+ANIMATION_CACHE_SIZE = 8
+
+# resolution of animation frames, screen-sized rather than print-sized
+ANIMATION_DPI = 100
+
+# seconds a render waits before starting, so the values passed while dragging a slider never render
+DEBOUNCE_SECONDS = 0.3
+
+# seconds to wait for the full render before showing a preview
+PREVIEW_AFTER_SECONDS = 0.5
+
+# seconds between progress updates while waiting for the full render
+POLL_SECONDS = 0.1
+
+# resolution and IFS points of the preview shown while the full render runs
+PREVIEW_DPI = 30
+PREVIEW_POINTS = {"Points": 10 ** 4, "Density": 10 ** 5}
+
+
+class NotCached(Exception):
+    """Raised by `cached_render` and `cached_animation` when the result is not cached and no finished job is given."""
+
+
+@st.cache_data(max_entries=RENDER_CACHE_SIZE, show_spinner=False)
+def cached_render(color_list, dot_size, gap_size, canvas_size, canvas_shape, shape, dpi, figsize_ratio, image_format,
+                  renderer, fern_mode, n, seed, cull, ifs_definition, compress_level, _job=None):
+    """
+    Look up a painting in the render cache, shared across reruns and sessions.
+
+    The encoded bytes are kept in a size-bounded LRU cache keyed on the full parameter tuple. Paintings are
+    rendered by a `RenderJob` on a worker thread rather than here: on a miss, the painting is taken from
+    the finished `_job`, which is not part of the key. Without one the miss raises `NotCached`, which is
+    not cached either, so the app can check the cache before it starts a job.
+
+    Returns:
+        bytes: The encoded SVG, JPEG, PNG or WebP image.
+    """
+    if _job is None:
+        raise NotCached()
+    return _job.result()
+
+
+@st.cache_data(max_entries=RENDER_CACHE_SIZE, show_spinner=False)
+def cached_preview(color_list, dot_size, gap_size, canvas_size, canvas_shape, shape, figsize_ratio, fern_mode, n,
+                   seed, cull, ifs_definition):
+    """
+    Render a quick, low-resolution JPEG of a painting to show while the full render runs.
+
+    The fern and the other IFS shapes are previewed with at most `PREVIEW_POINTS` points, so the preview
+    costs about the same whatever the settings.
+
+    Returns:
+        bytes: The encoded JPEG image.
+    """
+    return render_painting(color_list, dot_size, gap_size, canvas_size, canvas_shape, shape, PREVIEW_DPI,
+                           figsize_ratio, "JPEG", "Direct", fern_mode, min(n, PREVIEW_POINTS[fern_mode]), seed, cull,
+                           metrics=RenderMetrics(),  # previews are not published as renders
+                           ifs_definition=ifs_definition)
+
+
+@st.cache_data(max_entries=ANIMATION_CACHE_SIZE, show_spinner=False)
+def cached_animation(color_list, dot_size, gap_size, canvas_size, canvas_shape, shape, figsize_ratio, image_format, n,
+                     seed, cull, num_frames, ifs_definition, _job=None):
+    """
+    Look up a growing dot painting in the animation cache, shared across reruns and sessions.
+
+    Like `cached_render`, the animation is rendered by a `RenderJob` and taken from the finished `_job`
+    on a miss; without one the miss raises `NotCached`.
+
+    Returns:
+        bytes: The encoded GIF or MP4 animation.
+    """
+    if _job is None:
+        raise NotCached()
+    return _job.result()
+
+
 def vertical_spacer(n):
     for i in range(n):
         st.write("")
@@ -34,7 +117,7 @@ class DotPainter:
     color styles, and more.
 
     Attributes:
-        color_list (list): A list of colors based on the selected color style.
+        color_list (np.ndarray): The (N, 4) RGBA colors of the selected color style.
     """
 
     def __init__(self):
@@ -56,7 +139,9 @@ class DotPainter:
         self.n = 1000  # Default value for Barnsley Fern Shape
 
     def create_dot_painting(self, dot_size, gap_size, canvas_size, canvas_shape, shape, dpi, figsize_ratio=1.0,
-                            image_format="SVG"):
+                            image_format="SVG", renderer="Direct", svgz=False, fern_mode="Points", seed=0,
+                            debug=False, cull=False, animation_format=None, num_frames=100, ifs_definition=None,
+                            compress_level=6):
         """
         Create a dot painting with the specified parameters.
 
@@ -66,158 +151,159 @@ class DotPainter:
             canvas_size (int): The size of the canvas where dots will be painted.
             canvas_shape (str): The shape of the canvas.
             shape (str): The shape of individual dots (e.g., circle, square).
-            dpi (int): The resolution for JPEG images.
+            dpi (int): The resolution for JPEG, PNG and WebP images.
             figsize_ratio (float): The ratio to adjust the figure size.
-            image_format (str): The image format for saving (SVG or JPEG).
+            image_format (str): The image format for saving (SVG, JPEG, PNG, palette-indexed, or lossless WEBP).
+            renderer (str): Either "Direct" (NumPy rasterizer or compact SVG writer) or "Matplotlib".
+            svgz (bool): Whether the SVG download is gzip-compressed (SVGZ).
+            fern_mode (str): How the Barnsley fern and the other IFS shapes are drawn, either "Points" (one dot
+                per point) or "Density" (hits per pixel, tone-mapped through the color list; never an SVG).
+            seed (int): The seed for every random pick, identical parameters and seed give identical paintings.
+            debug (bool): Whether to show the stage timings and counters of the render in the sidebar.
+            cull (bool): Whether to drop the dots of the ring layouts that sit closer than the gap size.
+            animation_format (str, optional): Also offer the painting growing dot by dot as a GIF or MP4 download.
+            num_frames (int): The number of frames of the animation.
+            ifs_definition (str, optional): The JSON definition of the "custom IFS" canvas shape.
+            compress_level (int): The PNG and WebP compression effort, from 0 (fastest) to 9 (smallest).
 
         This method creates a dot painting based on the specified parameters and displays it in the Streamlit app.
         """
         n = self.n  # Access n from the class attribute for Barnsley Fern Shape
-
-        # Calculate the actual figsize using the given ratio
-        figsize = canvas_size / 100 * figsize_ratio
-
-        # Create a figure and axis
-        fig, ax = plt.subplots(figsize=(figsize, figsize))
-
-        # Set the aspect ratio to be equal so the dots are round
-        ax.set_aspect('equal')
-
-        # Turn off the axis
-        ax.axis('off')
-
-        # Calculate the number of rows and columns in the grid based on canvas size and gap size
-        rows = int(canvas_size / gap_size)
-        cols = int(canvas_size / gap_size)
-
-        # Define the marker shape based on the selected shape
-        shape_to_marker = {
-            "circle": 'o',
-            "square": 's',
-            "triangle": '^',
-            "pentagon": 'p',
-            "hexagon": 'H',
-            "diamond": 'D'
-        }
-
-        marker = shape_to_marker.get(shape, 'o')  # Default to circle if shape is not recognized
-
-        if canvas_shape == "square":
-            for row in range(rows):
-                for col in range(cols):
-                    x = col * gap_size
-                    y = row * gap_size
-                    color = random.choice(self.color_list)
-                    ax.scatter(x, y, c=[color], s=dot_size, marker=marker)
-
-        elif canvas_shape == "circle1":
-            # Calculate the number of dots to evenly distribute within the circle
-            circle_radius = min(canvas_size, canvas_size) / 2
-            num_circles = int(circle_radius / gap_size)  # Number of circles to draw
-            num_dots_per_circle = 50  # Increase the number of dots for a fuller circle
-
-            for i in range(num_circles):
-                radius = (i + 1) * gap_size  # Increase the radius for each circle
-                theta = np.linspace(0, 2 * np.pi, num_dots_per_circle)
-                x = radius * np.cos(theta) + canvas_size / 2
-                y = radius * np.sin(theta) + canvas_size / 2
-
-                colors = [random.choice(self.color_list) for _ in range(num_dots_per_circle)]
-                ax.scatter(x, y, c=colors, s=dot_size, marker=marker)  # Use 'o' for a circle
-
-        elif canvas_shape == "circle2":
-            # Calculate the number of dots to evenly distribute within the circle
-            circle_radius = min(canvas_size, canvas_size) / 2
-
-            # Calculate the number of circles based on the gap size
-            num_circles = int(circle_radius / gap_size)  # Number of circles to draw
-
-            # Create a figure and axis
-            fig, ax = plt.subplots(figsize=(canvas_size / 100 * figsize_ratio, canvas_size / 100 * figsize_ratio))
-            ax.set_aspect('equal')
-            ax.axis('off')
-
-            # Add a single dot in the center
-            ax.scatter(canvas_size / 2, canvas_size / 2, c=[random.choice(self.color_list)], s=dot_size, marker=marker)
-
-            for i in range(num_circles):
-                radius = (i + 1) * gap_size
-                n = 7 * (i + 1)  # 6 dots in each circle
-                theta = np.linspace(0, 2 * np.pi, n)
-                x = radius * np.cos(theta) + canvas_size / 2
-                y = radius * np.sin(theta) + canvas_size / 2
-                colors = [random.choice(self.color_list) for _ in range(n)]
-                ax.scatter(x, y, c=colors, s=dot_size, marker=marker)
-
-        elif canvas_shape == "golden ratio":
-            # Adjust the number of dots based on gap_size
-            num_dots = int(2 * np.pi * (canvas_size / 2) / gap_size)
-            # phi = (1 + np.sqrt(5)) / 2  # Golden ratio
-
-            fig, ax = plt.subplots(figsize=(canvas_size / 100 * figsize_ratio, canvas_size / 100 * figsize_ratio))
-            ax.set_aspect('equal')
-            ax.axis('off')
-
-            angles = np.linspace(0, 2 * np.pi * num_dots, num_dots)
-            radii = np.sqrt(1.0 * np.arange(num_dots)) / np.sqrt(num_dots)
-            x = radii * np.cos(angles) * canvas_size / 2 + canvas_size / 2
-            y = radii * np.sin(angles) * canvas_size / 2 + canvas_size / 2
-
-            colors = [random.choice(self.color_list) for _ in range(num_dots)]
-            ax.scatter(x, y, c=colors, s=dot_size, marker=marker)
-
-        if canvas_shape == "barnsley fern":
-            # load bar
-            my_bar = st.progress(0, text="Operation in progress. Please wait.")
-
-            blf = BarnsleyFern()
-            color_list = self.color_list
-            x, y, colors = blf.draw_fern(n, color_list)
-            fig, ax = plt.subplots(figsize=(5, 5))
-            ax.axis('off')
-
-            for i in range(n):
-                color = colors[i]
-                ax.scatter(x[i], y[i], s=1, c=color)
-
-                # load bar show progress to user
-                my_bar.progress((i / n), text=f"fern in progress: {int((i / n) * 100)+1}%")
-
-            # clear load bar
-            my_bar.empty()
+        image_format = output_format(canvas_shape, fern_mode, image_format)
+
+        metrics = RenderMetrics()
+        parameters = (self.color_list, dot_size, gap_size, canvas_size, canvas_shape, shape, dpi, figsize_ratio,
+                      image_format, renderer, fern_mode, n, seed, cull, ifs_definition, compress_level)
+        # the palette array does not compare as a single value, its bytes do
+        key = (self.color_list.tobytes(),) + parameters[1:]
+        job = st.session_state.get("render_job")
+        if job is not None and job.key != key:
+            # a render still queued or running for earlier settings is superseded, e.g. while a slider is dragged
+            job.cancel()
+            job = None
+        elif job is not None and job.failed():
+            # a failed render is tried again on the next run instead of raising its error every time
+            job = None
+
+        canvas = st.empty()
+        try:
+            painting = cached_render(*parameters)
+            metrics.counters["cache_hit"] = 1
+        except NotCached:
+            if job is None:
+                def render(progress_callback):
+                    metrics.split("queue")
+                    return render_painting(*parameters[:-2], progress_callback=progress_callback, metrics=metrics,
+                                           ifs_definition=ifs_definition, compress_level=compress_level)
+
+                job = RenderJob(render, key=key, delay=DEBOUNCE_SECONDS)
+                st.session_state["render_job"] = job
+            if not job.wait(PREVIEW_AFTER_SECONDS):
+                canvas.image(cached_preview(self.color_list, dot_size, gap_size, canvas_size, canvas_shape, shape,
+                                            figsize_ratio, fern_mode, n, seed, cull, ifs_definition))
+                # load bar
+                my_bar = st.progress(0, text="Rendering at full quality. Please wait.")
+                while not job.wait(POLL_SECONDS):
+                    # every update also lets Streamlit stop this run when the settings change
+                    my_bar.progress(job.progress, text=f"Rendering at full quality: {int(job.progress * 100)}%")
+                # clear load bar
+                my_bar.empty()
+            painting = cached_render(*parameters, _job=job)
+            metrics.counters["cache_hit"] = 0
+        metrics.split("render")
 
         if image_format == "SVG":
-            # Create an SVG image
-            buffer = BytesIO()
-            plt.savefig(buffer, format="svg", bbox_inches='tight')  # Use 'tight' to remove excess white space
-            buffer.seek(0)
-            svg_content = f'''<div style="text-align: center; ">{buffer.getvalue().decode()}</div>'''
-            st.markdown(svg_content, unsafe_allow_html=True)
+            svg_content = f'''<div style="text-align: center; ">{painting.decode()}</div>'''
+            canvas.markdown(svg_content, unsafe_allow_html=True)
+            metrics.count("markup_bytes", len(svg_content))
         else:
-            # Create a JPEG image
-            buffer = BytesIO()
-            plt.savefig(buffer, format="jpeg", bbox_inches='tight', dpi=dpi)  # Use 'tight' to remove excess white space
-            buffer.seek(0)
-            st.image(buffer)
+            canvas.image(painting)
+        metrics.split("display")
 
         with st.sidebar:
             with st.columns([1, 10, 1])[1]:
-                if image_format == "SVG":
+                if image_format == "SVG" and svgz:
+                    st.download_button(
+                        label=f"Download Image (SVGZ)",
+                        data=gzip.compress(painting, mtime=0),
+                        file_name=f"dot_painting.svgz",
+                        mime="image/svg+xml",
+                        key="svgz_download_button",
+                        use_container_width=True)
+                elif image_format == "SVG":
                     st.download_button(
                         label=f"Download Image (SVG)",
-                        data=buffer,
+                        data=painting,
                         file_name=f"dot_painting.svg",
                         mime="image/svg+xml",
                         key="svg_download_button",
                         use_container_width=True)
                 else:
+                    extension = FILE_EXTENSIONS[image_format]
+                    st.download_button(
+                        label=f"Download Image ({image_format})",
+                        data=painting,
+                        file_name=f"dot_painting.{extension}",
+                        mime=f"image/{extension}",
+                        key=f"{extension}_download_button",
+                        use_container_width=True)
+
+                if animation_format is not None:
+                    animation = self.create_animation(dot_size, gap_size, canvas_size, canvas_shape, shape,
+                                                      figsize_ratio, animation_format, n, seed, cull, num_frames,
+                                                      ifs_definition)
+                    extension, mime = ANIMATION_FORMATS[animation_format]
                     st.download_button(
-                        label=f"Download Image (JPEG)",
-                        data=buffer,
-                        file_name=f"dot_painting.jpeg",
-                        mime="image/jpeg",
-                        key="jpeg_download_button",
+                        label=f"Download Animation ({animation_format})",
+                        data=animation,
+                        file_name=f"dot_painting.{extension}",
+                        mime=mime,
+                        key="animation_download_button",
                         use_container_width=True)
+        metrics.split("download")
+
+        publish(metrics, "app render", canvas_shape=canvas_shape, image_format=image_format, renderer=renderer)
+        if debug:
+            with st.sidebar:
+                my_text_header('debug', my_font_family='Oswald')
+                st.json(metrics.as_dict())
+
+    def create_animation(self, dot_size, gap_size, canvas_size, canvas_shape, shape, figsize_ratio, animation_format,
+                         n, seed, cull, num_frames, ifs_definition):
+        """
+        Get the growing dot painting from the animation cache, or render it on a worker thread.
+
+        The render is a `RenderJob` like the one of the painting: it waits out the debounce delay, takes a
+        render slot and is cancelled once the settings change.
+
+        Returns:
+            bytes: The encoded GIF or MP4 animation.
+        """
+        parameters = (self.color_list, dot_size, gap_size, canvas_size, canvas_shape, shape, figsize_ratio,
+                      animation_format, n, seed, cull, num_frames, ifs_definition)
+        key = (self.color_list.tobytes(),) + parameters[1:]
+        job = st.session_state.get("animation_job")
+        if job is not None and (job.key != key or job.failed()):
+            job.cancel()
+            job = None
+
+        try:
+            return cached_animation(*parameters)
+        except NotCached:
+            if job is None:
+                def render(progress_callback):
+                    return render_animation(self.color_list, dot_size, gap_size, canvas_size, canvas_shape, shape,
+                                            ANIMATION_DPI, figsize_ratio, animation_format, n, seed, cull, num_frames,
+                                            progress_callback=progress_callback, ifs_definition=ifs_definition)
+
+                job = RenderJob(render, key=key, delay=DEBOUNCE_SECONDS)
+                st.session_state["animation_job"] = job
+            my_bar = st.progress(0, text="Rendering animation...")
+            while not job.wait(POLL_SECONDS):
+                # every update also lets Streamlit stop this run when the settings change
+                my_bar.progress(job.progress, text=f"Rendering animation: {int(job.progress * 100)}%")
+            my_bar.empty()
+            return cached_animation(*parameters, _job=job)
 
     def run(self):
         """
@@ -243,19 +329,47 @@ class DotPainter:
                 dot_size = st.slider("Dot Size", 5, 800, 800)
                 gap_size = st.slider("Gap Size", 10, 50, 24)
                 num_colors = st.slider("Number of Colors", 1, 25, 10)
+                seed = st.number_input("Seed", min_value=0, max_value=2 ** 32 - 1, value=0, step=1)
+
+                base_color = "#0000FF"
+                if color_style == "Mono 2":
+                    base_color = st.color_picker("Choose a Base Color", base_color)
 
                 # Call the get_color_list function to set self.color_list based on the selected color_style
-                self.color_list = get_color_list(color_style, num_colors)
+                self.color_list = get_color_list(color_style, num_colors, base_color)
 
             with col3:
-                shape = st.selectbox("Dot Shape", ["circle", "square", "triangle", "pentagon", "hexagon", "diamond"])
-                canvas_shape = st.selectbox("Shape", ["square", "circle1", "circle2", "golden ratio", "barnsley fern"], index=0)
+                shape = st.selectbox("Dot Shape", list(DOT_MARKERS))
+                canvas_shape = st.selectbox("Shape", CANVAS_LAYOUTS + IFS_SHAPES, index=0)
                 canvas_size = st.slider("Canvas Size", 70, 800, 228)
                 figsize_ratio = st.slider("Figsize Ratio", 0.1, 10.0, 3.33)
 
+            fern_mode = "Points"
+            cull = False
+            ifs_definition = None
             with col2:
-                if canvas_shape == "barnsley fern":
-                    n = st.slider('Number of points in the Fern', 100, 10000, 1000)  # Barnsley Fern Shape
+                if canvas_shape in ("circle1", "circle2"):
+                    cull = st.checkbox("Remove overlapping dots", value=False)
+                if canvas_shape == CUSTOM_IFS:
+                    ifs_definition = st.text_area("IFS Definition (JSON)",
+                                                  json.dumps(IFS_PRESETS["sierpinski triangle"], indent=1),
+                                                  help='"maps": a list of [[a, b, e], [c, d, f]] affine maps, '
+                                                       'x\' = a x + b y + e and y\' = c x + d y + f; '
+                                                       '"probabilities" (optional): one weight per map')
+                    try:
+                        parse_ifs(ifs_definition)
+                    except ValueError as error:
+                        st.error(f"Invalid IFS definition: {error}")
+                        return
+                if canvas_shape in IFS_SHAPES:
+                    fern_mode = st.selectbox("Point Rendering", ["Points", "Density"], index=0)
+                    if fern_mode == "Density":
+                        # memory does not grow with the number of points, so allow print-size counts
+                        self.n = st.select_slider('Number of Points',
+                                                  [10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8, 10 ** 9], 10 ** 6,
+                                                  format_func=lambda value: f"{value:,}")
+                    else:
+                        self.n = st.slider('Number of Points', 100, 100000, 1000)  # Barnsley Fern and other IFS shapes
 
             # =============================================================================
             # Download
@@ -264,14 +378,37 @@ class DotPainter:
 
             col1, col2, col3 = st.columns([1, 10, 1])
             with col2:
-                image_format = st.selectbox("Image Format", ["SVG", "JPEG"], index=0)
-            if image_format == "JPEG":
+                # the density fern is a raster image
+                image_formats = ["JPEG", "PNG", "WEBP"] if fern_mode == "Density" else ["SVG", "JPEG", "PNG", "WEBP"]
+                image_format = st.selectbox("Image Format", image_formats, index=0)
+            svgz = False
+            compress_level = 6
+            if image_format != "SVG":
                 with col2:
                     dpi = st.selectbox("Resolution (DPI)", [100, 200, 300], index=2)
+                    if image_format in ("PNG", "WEBP"):
+                        # compression only trades encode time for size, never quality
+                        compress_level = st.slider("Compression Level", 0, 9, 6)
             else:
                 dpi = 300
-
-        self.create_dot_painting(dot_size, gap_size, canvas_size, canvas_shape, shape, dpi, figsize_ratio, image_format)
+                with col2:
+                    svgz = st.checkbox("Compressed download (SVGZ)", value=False)
+            with col2:
+                if fern_mode == "Points":
+                    renderer = st.selectbox("Renderer", ["Direct", "Matplotlib"], index=0)
+                else:
+                    renderer = "Direct"
+                animation_format = None
+                num_frames = 100
+                if (canvas_shape == "golden ratio" or canvas_shape in IFS_SHAPES) and fern_mode == "Points":
+                    if st.checkbox("Animated download", value=False):
+                        animation_format = st.selectbox("Animation Format", available_formats(), index=0)
+                        num_frames = st.slider("Frames", 10, 300, 100)
+                debug = st.checkbox("Show debug panel", value=False)
+
+        self.create_dot_painting(dot_size, gap_size, canvas_size, canvas_shape, shape, dpi, figsize_ratio, image_format,
+                                 renderer, svgz, fern_mode, seed, debug, cull, animation_format, num_frames,
+                                 ifs_definition, compress_level)
 
 
 if __name__ == "__main__":
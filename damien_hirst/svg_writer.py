@@ -0,0 +1,102 @@
+import gzip
+import numpy as np
+from matplotlib import rcParams
+from matplotlib.colors import to_hex, to_rgba_array
+from matplotlib.markers import MarkerStyle
+from matplotlib.path import Path
+from raster_backend import axes_layout
+
+# number of dots formatted and written per chunk
+CHUNK_SIZE = 4096
+
+# SVG user units are points, like matplotlib's SVG backend
+POINTS_PER_INCH = 72
+
+SVG_COMMANDS = {Path.MOVETO: 'M', Path.LINETO: 'L', Path.CURVE3: 'Q', Path.CURVE4: 'C', Path.CLOSEPOLY: 'Z'}
+
+
+def path_data(path):
+    """
+    Convert a matplotlib path to SVG path data, flipping the y axis to point down.
+
+    Args:
+        path (matplotlib.path.Path): The path to convert.
+
+    Returns:
+        str: The value of the `d` attribute.
+    """
+    commands = []
+    for vertices, code in path.iter_segments(simplify=False):
+        if code == Path.CLOSEPOLY:
+            commands.append('Z')
+        else:
+            points = vertices.reshape(-1, 2) * [1, -1]
+            commands.append(SVG_COMMANDS[code] + ' '.join(f'{px:.4g} {py:.4g}' for px, py in points))
+    return ''.join(commands)
+
+
+def write_svg(stream, x, y, colors, marker_size, marker, figsize, equal_aspect=True, compress=False):
+    """
+    Write a dot painting as a compact SVG document.
+
+    The marker shape is defined once in `<defs>` and every dot is a `<use>` of it with rounded
+    coordinates and a short color class, instead of a full path per dot. The layout matches the
+    matplotlib path (`ax.scatter` on an axis-less axes saved with `bbox_inches='tight'`). The document
+    is written to `stream` in chunks, so it is never built as one large string.
+
+    Args:
+        stream (file-like): The binary stream to write to.
+        x (np.ndarray): The x coordinates of the dots.
+        y (np.ndarray): The y coordinates of the dots.
+        colors (array-like): One color per dot (hex strings or RGBA rows).
+        marker_size (float): The marker size in points ** 2.
+        marker (str): The matplotlib marker of every dot.
+        figsize (float): The width and height of the figure in inches.
+        equal_aspect (bool): Whether the axes use an equal aspect ratio.
+        compress (bool): Whether to write gzip-compressed SVG (SVGZ).
+    """
+    if compress:
+        with gzip.GzipFile(fileobj=stream, mode='wb', mtime=0) as gzip_stream:
+            write_svg(gzip_stream, x, y, colors, marker_size, marker, figsize, equal_aspect)
+        return
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    cols, rows, box_width, box_height = axes_layout(x, y, figsize, POINTS_PER_INCH, equal_aspect)
+    # a hundredth of a point is well below what any viewer or printer resolves
+    cols = np.round(cols, 2)
+    rows = np.round(rows, 2)
+    pad = rcParams['savefig.pad_inches'] * POINTS_PER_INCH
+    width = box_width + 2 * pad
+    height = box_height + 2 * pad
+
+    marker_style = MarkerStyle(marker)
+    path = marker_style.get_path().transformed(marker_style.get_transform().scale(np.sqrt(marker_size)))
+    palette, color_index = np.unique(to_rgba_array(colors), axis=0, return_inverse=True)
+    color_index = color_index.ravel()
+
+    def write(text):
+        stream.write(text.encode())
+
+    write(f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" class="dot-painting" '
+          f'width="{width:.2f}pt" height="{height:.2f}pt" viewBox="0 0 {width:.2f} {height:.2f}">\n')
+    write('<defs>\n<style>')
+    for index, color in enumerate(palette):
+        # the marker is filled and stroked with the current color, like scatter's edgecolors='face';
+        # the selectors and ids are scoped because the markup may be inlined into a page
+        opacity = f';opacity:{color[3]:.3g}' if color[3] < 1 else ''
+        write(f'.dot-painting .c{index}{{color:{to_hex(color)}{opacity}}}')
+    write('</style>\n')
+    write(f'<path id="dot-painting-marker" d="{path_data(path)}" fill="currentColor" stroke="currentColor" '
+          f'stroke-width="{rcParams["lines.linewidth"]:g}" stroke-linejoin="{marker_style.get_joinstyle()}"/>\n')
+    write(f'<clipPath id="dot-painting-clip"><rect width="{box_width:.2f}" height="{box_height:.2f}"/>'
+          f'</clipPath>\n</defs>\n')
+    write('<rect width="100%" height="100%" fill="#ffffff"/>\n')
+
+    # dots are clipped to the axes box
+    write(f'<g clip-path="url(#dot-painting-clip)" transform="translate({pad:.2f} {pad:.2f})">\n')
+    for start in range(0, len(x), CHUNK_SIZE):
+        chunk = slice(start, start + CHUNK_SIZE)
+        write(''.join(f'<use xlink:href="#dot-painting-marker" x="{col:g}" y="{row:g}" class="c{index}"/>\n'
+                      for col, row, index in zip(cols[chunk], rows[chunk], color_index[chunk])))
+    write('</g>\n</svg>\n')